@@ -14,8 +14,8 @@ from visuals import (
 from tts import process_tts
 from video_assembler import assemble_video
 import captions
-from overlay import add_text_overlay
-from config import VISUALS_DIR, VIDEO_SCRIPTS_DIR, FINAL_VIDEO_DIR
+from overlay import add_overlay_layers
+from config import VISUALS_DIR, VIDEO_SCRIPTS_DIR, FINAL_VIDEO_DIR, OVERLAY_LAYERS
 
 # Ensure required directories exist
 for directory in [VISUALS_DIR, VIDEO_SCRIPTS_DIR, FINAL_VIDEO_DIR]:
@@ -30,6 +30,16 @@ def parse_args():
     parser.add_argument("--length", type=int, help="Total video length in seconds")
     parser.add_argument("--num-sections", type=int, dest="num_sections", help="Number of sections")
     parser.add_argument("--num-segments", type=int, dest="num_segments", help="Number of segments per section")
+    parser.add_argument("--backend", choices=["moviepy", "ffmpeg", "parallel"], default=None,
+                        help="Render backend for assembly (default: script setting or moviepy)")
+    parser.add_argument("--draft", action="store_true",
+                        help="Render a reduced resolution/frame rate preview with a fast preset")
+    parser.add_argument("--whisper-captions", action="store_true", dest="whisper_captions",
+                        help="Refine caption timing with a Whisper transcription of the render")
+    parser.add_argument("--transcriber", choices=["openai", "local"], default=None,
+                        help="Transcription backend (default: TRANSCRIPTION_BACKEND env or openai)")
+    parser.add_argument("--sidecar-captions", action="store_true", dest="sidecar_captions",
+                        help="Ship SRT/WebVTT caption files instead of burning captions into the video")
     return parser.parse_args()
 
 
@@ -66,22 +76,39 @@ def generate_and_download_images(script, model_style="Leonardo Phoenix"):
     return script
 
 
-def create_captions(video_path):
-    """Run Whisper via the captions helper to create a caption list."""
+def transcribe_video(video_path, backend=None):
+    """Run Whisper (hosted or local) on the video's audio track."""
     audio_temp = captions.extract_audio(video_path)
-    transcription = captions.transcribe_audio_whisper(audio_temp)
-    cap_list = captions.generate_captions_from_whisper(transcription)
+    transcription = captions.transcribe_audio_whisper(audio_temp, backend)
     # Clean up temp audio
     try:
         if audio_temp and Path(audio_temp).exists():
             Path(audio_temp).unlink()
     except Exception:
         pass
-    return cap_list
+    return transcription
+
+
+def create_captions(video_path, script=None, use_whisper=False, backend=None):
+    """
+    Build the caption list from the script's narration text and timeline.
+    With use_whisper, Whisper refines the timing (or supplies the captions
+    outright if the script carries no timeline).
+    """
+    cap_list = captions.generate_captions_from_script(script) if script else []
+    if cap_list and not use_whisper:
+        return cap_list
+    transcription = transcribe_video(video_path, backend)
+    if not transcription:
+        return cap_list
+    if cap_list:
+        return captions.refine_captions_with_whisper(cap_list, transcription)
+    return captions.generate_captions_from_whisper(transcription)
 
 
 def main():
     args = parse_args()
+    profile = "draft" if args.draft else "final"
     if all([args.topic, args.length, args.num_sections, args.num_segments]):
         topic = args.topic
         size = args.size
@@ -98,7 +125,7 @@ def main():
         return
 
     # 2. Generate & download visuals
-    script = generate_and_download_images(script)
+    script = generate_and_download_images(script, script.get("image_style", "Leonardo Phoenix"))
 
     # 3. Generate narration TTS & update script
     script = process_tts(script)
@@ -110,7 +137,11 @@ def main():
     print(f"Script saved to {script_json_path}")
 
     # 5. Assemble video (returns path to raw video)
-    raw_video_path = Path(assemble_video(str(script_json_path))).resolve()
+    assembled = assemble_video(str(script_json_path), backend=args.backend, profile=profile)
+    if not assembled:
+        print("assemble_video did not produce a video – aborting.")
+        return
+    raw_video_path = Path(assembled).resolve()
     if not raw_video_path.exists():
         print(f"assemble_video did not produce expected file at {raw_video_path} – aborting.")
         return
@@ -120,13 +151,25 @@ def main():
     
     # 6. Captioning (write to new file to avoid in-place overwrite issues)
     captioned_video_path = raw_video_path.with_name(raw_video_path.stem + "_cap.mp4")
-    caption_list = create_captions(str(raw_video_path))
+    # assemble_video records each segment's timeline placement in the script JSON
+    with open(script_json_path) as f:
+        script = json.load(f)
+    caption_list = create_captions(str(raw_video_path), script, use_whisper=args.whisper_captions,
+                                   backend=args.transcriber)
+    final_output_path = FINAL_VIDEO_DIR / f"{topic.replace(' ','_')}_{profile}.mp4"
     if caption_list:
+        # Sidecars carry the same caption timing as the burned-in captions
+        for path in captions.export_caption_sidecars(caption_list, str(final_output_path)):
+            print(f"Captions saved to {path}")
+    if caption_list and args.sidecar_captions:
+        print("Sidecar captions requested; skipping caption burn-in.")
+    elif caption_list:
         try:
             captions.add_captions_to_video(
                 input_video_path=str(raw_video_path),
                     transcription=caption_list,
-                output_video_path=str(captioned_video_path)
+                output_video_path=str(captioned_video_path),
+                profile=profile
             )
         except Exception as e:
             print(f"Captioning failed: {e}")
@@ -137,27 +180,12 @@ def main():
     if not captioned_video_path.exists():
         captioned_video_path = raw_video_path
 # 7. Header / footer overlay
-    final_output_path = FINAL_VIDEO_DIR / f"{topic.replace(' ','_')}_final.mp4"
-    add_text_overlay(
+    add_overlay_layers(
         input_video_path=str(captioned_video_path),
         output_video_path=str(final_output_path),
-        start_text="Comment Below: Your Idea Could Be Next!",
-        end_text="Want to see your idea here? Comment Below!",
-        start_duration=5,
-        end_duration=5,
-        start_font_path="Bangers-Regular.ttf",
-        end_font_path="Bangers-Regular.ttf",
-        start_fontsize=75,
-        end_fontsize=75,
-        start_position=(20, 300),
-        end_position=(20, 1500),
-        text_color="white",
-        bg_color=(0, 0, 0),
-        col_opacity=0.3,
-        padding=5,
-        fade_in=True,
-        fade_out=True,
-        fade_duration=1,
+        layers=OVERLAY_LAYERS,
+        profile=profile,
+        script=script,
     )
 
     print(f"Video processing complete! Final video saved at {final_output_path}")
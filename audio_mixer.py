@@ -0,0 +1,86 @@
+import wave
+import numpy as np
+from sound_bank import SAMPLE_RATE, CHANNELS, decode_pcm, transition_variant, looped
+
+# -------------------- Ducking --------------------
+DUCK_GAIN = 0.35        # Music gain while narration is playing
+DUCK_THRESHOLD = 0.02   # Narration RMS above which music ducks
+DUCK_WINDOW = 0.02      # Envelope block size in seconds
+DUCK_ATTACK = 0.08      # Seconds to ramp down when narration starts
+DUCK_RELEASE = 0.4      # Seconds to ramp back up after narration stops
+
+
+def place(buffer, pcm, start, gain=1.0):
+    """Add pcm * gain into buffer at `start` seconds, clipped to the buffer."""
+    offset = max(0, int(round(start * SAMPLE_RATE)))
+    end = min(len(buffer), offset + len(pcm))
+    if end > offset:
+        buffer[offset:end] += pcm[:end - offset] * gain
+
+
+def smooth(gain, window):
+    """Moving average over `window` blocks, edge-padded so the length is unchanged."""
+    if window <= 1:
+        return gain
+    padded = np.pad(gain, (window - 1, 0), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+
+def duck_envelope(voice, duck_gain=DUCK_GAIN, threshold=DUCK_THRESHOLD):
+    """
+    Per-sample music gain from the narration track: duck_gain wherever the
+    narration's block RMS exceeds threshold, 1.0 elsewhere, with a short attack
+    and a slower release so the music does not pump between words.
+    """
+    block = max(1, int(DUCK_WINDOW * SAMPLE_RATE))
+    num_blocks = -(-len(voice) // block)
+    padded = np.zeros((num_blocks * block, CHANNELS), dtype=np.float32)
+    padded[:len(voice)] = voice
+    rms = np.sqrt((padded.reshape(num_blocks, -1) ** 2).mean(axis=1))
+    target = np.where(rms > threshold, duck_gain, 1.0)
+
+    # Release: hold the ducked level while any recent block was loud, then ramp up.
+    # Attack: a short ramp down, applied by smoothing the held gain.
+    release = max(1, int(DUCK_RELEASE / DUCK_WINDOW))
+    padded_target = np.pad(target, (release - 1, 0), mode="edge")
+    held = np.lib.stride_tricks.sliding_window_view(padded_target, release).min(axis=1)
+    gain = smooth(held, max(1, int(DUCK_ATTACK / DUCK_WINDOW)))
+
+    centers = (np.arange(num_blocks) + 0.5) * block
+    return np.interp(np.arange(len(voice)), centers, gain).astype(np.float32)[:, None]
+
+
+def mix_timeline(segments, total_duration, bg_file=None, bg_volume=0.1, transition_volume=0.1,
+                 transition_fade=0.15, transition_offset=0.1, duck=True, duck_gain=DUCK_GAIN):
+    """
+    Mix narration, transition SFX and looped background music into one
+    (samples, CHANNELS) float32 buffer covering total_duration.
+    """
+    num_samples = max(1, int(round(total_duration * SAMPLE_RATE)))
+    voice = np.zeros((num_samples, CHANNELS), dtype=np.float32)
+    for seg in segments:
+        if seg.get("audio"):
+            place(voice, decode_pcm(seg["audio"]), seg["start"])
+
+    mix = voice.copy()
+    for seg in segments:
+        if seg.get("transition"):
+            start = max(seg["start"] + seg["duration"] - transition_offset, 0)
+            place(mix, transition_variant(seg["transition"], transition_fade), start, transition_volume)
+
+    if bg_file:
+        music = looped(bg_file, total_duration)[:num_samples] * bg_volume
+        if duck:
+            music = music * duck_envelope(voice, duck_gain)[:len(music)]
+        place(mix, music, 0)
+    return np.clip(mix, -1.0, 1.0, out=mix)
+
+
+def write_wav(pcm, path):
+    """Write float PCM as 16-bit stereo WAV."""
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((pcm * 32767).astype("<i2").tobytes())
+    return str(path)
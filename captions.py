@@ -2,49 +2,66 @@ import re
 import os
 import math
 import tempfile
+import subprocess
 from typing import List, Dict, Optional
-from moviepy.editor import TextClip, ImageClip, VideoFileClip, CompositeVideoClip
-from PIL import Image, ImageFilter
+from moviepy.editor import VideoFileClip
+from moviepy.config import get_setting
 import matplotlib.font_manager as fm
-import numpy as np
-import openai
+import pysrt
 import json
 from dotenv import load_dotenv
 
 load_dotenv()
 from config import CAPTION_SETTINGS, BASE_DIR  # import caption settings
+from render_profile import get_profile, scale_value, scale_position
+from compositor import TimelineCompositor
+from frame_writer import write_clip
+from text_layout import font_metrics, layout_lines
+from text_render import render_text, text_clip
+from karaoke import karaoke_clip
+from transcription import MissingAPIKeyError, transcribe
 
 api_key = os.getenv("OPENAI_API_KEY")
 
+# Speech-recognition input: 16 kHz mono is all Whisper uses internally
+TRANSCRIBE_SAMPLE_RATE = 16000
+MAX_WORDS_PER_CAPTION = 8
+SIDECAR_FORMATS = ("srt", "vtt")
+TRANSCRIBE_CODECS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"]),
+    "flac": (".flac", ["-c:a", "flac", "-sample_fmt", "s16"]),
+}
+
 # Function to extract audio from video
-def extract_audio(input_video_path: str) -> str:
-    try:
-        video = VideoFileClip(input_video_path)
-        audio = video.audio
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio_file:
-            audio.write_audiofile(temp_audio_file.name, codec="pcm_s16le")
-            audio_path = temp_audio_file.name
-        video.close()
-        return audio_path
-    except Exception as e:
-        print(f"Error extracting audio: {e}")
+def extract_audio(input_video_path: str, codec: str = "opus") -> str:
+    """
+    Stream the audio track out of the container with ffmpeg (no video decode),
+    downmixed to 16 kHz mono and encoded compactly for upload.
+    """
+    suffix, codec_args = TRANSCRIBE_CODECS[codec]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_audio_file:
+        audio_path = temp_audio_file.name
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-i", input_video_path,
+        "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(TRANSCRIBE_SAMPLE_RATE), *codec_args, audio_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"Error extracting audio: {result.stderr.decode(errors='replace')}")
+        os.remove(audio_path)
         return ""
+    return audio_path
 
-# Function to transcribe audio using Whisper
-def transcribe_audio_whisper(audio_file_path: str) -> Dict:
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    if not openai.api_key:
-        raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-
+# Function to transcribe audio using Whisper (hosted or local, cached by audio hash)
+def transcribe_audio_whisper(audio_file_path: str, backend: Optional[str] = None) -> Dict:
+    if not audio_file_path:
+        print("No audio to transcribe.")
+        return {}
     try:
-        with open(audio_file_path, "rb") as audio_file:
-            response = openai.Audio.transcribe(
-                file=audio_file,
-                model="whisper-1",
-                response_format="verbose_json"  # Ensure this returns detailed segment info
-            )
-        return response
-    except Exception as e:
+        return transcribe(audio_file_path, backend)
+    except MissingAPIKeyError:
+        raise
+    except Exception as e:  # Undecodable audio, missing local backend, API errors
         print(f"Error transcribing audio with Whisper: {e}")
         return {}
 
@@ -64,6 +81,46 @@ def generate_captions_from_whisper(transcription: Dict) -> List[Dict]:
 
     return captions
 
+# Function to build captions from the script's narration and assembled timeline
+def generate_captions_from_script(script: Dict) -> List[Dict]:
+    """
+    One caption per narrated segment, placed where assemble_video put it
+    (narration start/duration are recorded on the script during assembly).
+    """
+    captions = []
+    for section in script.get('sections', []):
+        for segment in section.get('segments', []):
+            narration = segment.get('narration', {})
+            text = narration.get('text', '').strip()
+            if not text or 'start' not in narration or not narration.get('duration'):
+                continue
+            captions.append({
+                "start": narration['start'],
+                "end": narration['start'] + narration['duration'],
+                "text": text
+            })
+    if not captions:
+        print("No timed narration found in script; run assemble_video first.")
+    return captions
+
+# Function to tighten script captions to the speech Whisper detected
+def refine_captions_with_whisper(captions: List[Dict], transcription: Dict) -> List[Dict]:
+    """
+    Keep the script's exact text but trim each caption's start/end to the
+    Whisper segments whose midpoints fall inside it (drops lead-in silence).
+    """
+    spoken = generate_captions_from_whisper(transcription)
+    refined = []
+    for caption in captions:
+        inside = [s for s in spoken if caption['start'] <= (s['start'] + s['end']) / 2 < caption['end']]
+        if inside:
+            start = max(caption['start'], min(s['start'] for s in inside))
+            end = min(caption['end'], max(s['end'] for s in inside))
+            if end > start:
+                caption = {**caption, "start": start, "end": end}
+        refined.append(caption)
+    return refined
+
 # Function to get default font
 
 def get_default_font() -> str:
@@ -82,87 +139,52 @@ def get_default_font() -> str:
 
     raise FileNotFoundError(f"Font file not found: {font_path}")
 
-# Function to check if text fits within the video width (handles multi-line)
+# Function to check if a single line of text fits within a width (glyph metrics, no rendering)
 def does_text_fit(text: str, fontsize: int, font: str, max_width: int) -> bool:
     try:
-        # Create a TextClip with 'caption' method to allow multi-line
-        txt_clip = TextClip(
-            txt=text,
-            fontsize=fontsize,
-            font=font,
-            method='caption',
-            size=(max_width, None),  # Width fixed, height auto
-            align='center'
-        )
-        return txt_clip.w <= max_width
-    except Exception as e:
-        print(f"Error creating TextClip for fitting: {e}")
+        return font_metrics(font, fontsize).width(text) <= max_width
+    except OSError as e:
+        print(f"Error loading font for fitting: {e}")
         return False
 
-# Function to split a word if it's too long
-def split_long_word(word: str, max_length: int = 15) -> List[str]:
-    if len(word) <= max_length:
-        return [word]
-    
-    split_words = []
-    current_word = word
-    while len(current_word) > max_length:
-        part = current_word[:max_length] + '-'
-        split_words.append(part)
-        current_word = current_word[max_length:]
-    split_words.append(current_word)
-    return split_words
-
-# Function to convert MoviePy clip to PIL Image
-def moviepy_to_pillow(clip) -> Image.Image:
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=True) as temp_file:
-        clip.save_frame(temp_file.name)
-        image = Image.open(temp_file.name).convert("RGBA")
-    return image
-
 # Main function to add captions to video
-def add_captions_to_video(
-    input_video_path: str,
+def caption_effects(scale: float = 1.0) -> Dict:
+    """render_text styling options from CAPTION_SETTINGS, with pixel sizes scaled for the profile."""
+    settings = CAPTION_SETTINGS
+    effects = {'bg_color': None, 'shadow': None, 'glow': None}
+    if settings.get('ENABLE_BACKGROUND_BOX', False):
+        effects.update(
+            bg_color=tuple(settings.get('BACKGROUND_COLOR', (0, 0, 0))),
+            bg_opacity=settings.get('BACKGROUND_OPACITY', 0.5),
+            padding=(scale_value(settings.get('BACKGROUND_PADDING_WIDTH', 20), scale),
+                     scale_value(settings.get('BACKGROUND_PADDING_HEIGHT', 20), scale)),
+            radius=scale_value(settings.get('ROUND_CORNER_RADIUS', 0), scale),
+        )
+    if settings.get('ENABLE_SHADOW', False):
+        offset_x, offset_y = settings.get('SHADOW_OFFSET', (6, 6))
+        effects['shadow'] = (scale_value(offset_x, scale), scale_value(offset_y, scale),
+                             scale_value(settings.get('SHADOW_BLUR', 4), scale),
+                             tuple(settings.get('SHADOW_COLOR', (0, 0, 0))), settings.get('SHADOW_OPACITY', 0.6))
+    if settings.get('ENABLE_GLOW', False):
+        effects['glow'] = (scale_value(settings.get('GLOW_RADIUS', 8), scale),
+                           tuple(settings.get('GLOW_COLOR', (255, 255, 255))), settings.get('GLOW_OPACITY', 0.5))
+    return effects
+
+
+# Group transcription segments into timed captions
+def group_captions(
     transcription: List[Dict],
-    output_video_path: str,
-    font_path: Optional[str] = None,
-    fontsize: int = CAPTION_SETTINGS.get('TEXT_SIZE',24),
-    color: str = CAPTION_SETTINGS.get('COLOR','white'),
-    stroke_color: str = CAPTION_SETTINGS.get('STROKE_COLOR','black'),
-    stroke_width: int = CAPTION_SETTINGS.get('STROKE_WIDTH',2),
-    position: tuple = ('center', CAPTION_SETTINGS.get('CAPTION_POSITION', ('center', 1240))[1]),
-    blur_radius: int = 0,
-    opacity: float = 1.0,
-    bg_color: str = 'transparent',
-    max_words_per_caption: int = 8,  # Adjusted as per user request
+    max_words_per_caption: int = MAX_WORDS_PER_CAPTION,
     time_scale: float = 1.0,
     start_delay: float = 0.0,
     duration_adjust: float = 0.0,
     per_caption_offset: Optional[Dict[int, float]] = None
-):
-    # Load the video
-    try:
-        video = VideoFileClip(input_video_path)
-    except Exception as e:
-        print(f"Error loading video file: {e}")
-        return
-
-    # Use default font if not provided
-    if font_path is None:
-        try:
-            font_path = get_default_font()
-        except FileNotFoundError as e:
-            print(e)
-            return
-
-    # Check if the font file exists
-    if not os.path.isfile(font_path):
-        print(f"Font file not found at {font_path}. Please provide a valid font file.")
-        return
-
-    # Define maximum width for captions (90% of video width)
-    max_caption_width = int(video.w * CAPTION_SETTINGS.get('SUBTITLE_MAX_WIDTH', 0.8))
-
+) -> List[Dict]:
+    """
+    Spread each segment's time evenly over its words, apply the timing
+    adjustments, and group the words into captions of up to
+    max_words_per_caption: [{"start", "end", "text", "words"}, ...].
+    """
     # Convert transcription segments to word-level list
     words_list = []
     for idx, segment in enumerate(transcription):
@@ -187,6 +209,7 @@ def add_captions_to_video(
     # Initialize variables for caption grouping
     captions = []
     current_caption = []
+    current_words = []
     current_start = None
     current_end = None
 
@@ -200,6 +223,7 @@ def add_captions_to_video(
             current_start = word_start
 
         current_caption.append(word)
+        current_words.append(word_info)
         current_end = word_end
 
         # Check if we've reached max words per caption
@@ -207,9 +231,11 @@ def add_captions_to_video(
             captions.append({
                 "start": current_start,
                 "end": current_end,
-                "text": " ".join(current_caption)
+                "text": " ".join(current_caption),
+                "words": current_words
             })
             current_caption = []
+            current_words = []
             current_start = None
             current_end = None
 
@@ -218,9 +244,121 @@ def add_captions_to_video(
         captions.append({
             "start": current_start,
             "end": current_end,
-            "text": " ".join(current_caption)
+            "text": " ".join(current_caption),
+            "words": current_words
         })
 
+    return captions
+
+
+# Sidecar caption files, for players and platforms that render captions themselves
+def captions_to_srt(captions: List[Dict]) -> pysrt.SubRipFile:
+    subs = pysrt.SubRipFile()
+    for idx, caption in enumerate(captions, start=1):
+        subs.append(pysrt.SubRipItem(
+            index=idx,
+            start=pysrt.SubRipTime.from_ordinal(int(round(max(caption["start"], 0) * 1000))),
+            end=pysrt.SubRipTime.from_ordinal(int(round(max(caption["end"], 0) * 1000))),
+            text=caption["text"]
+        ))
+    return subs
+
+
+def write_webvtt(subs: pysrt.SubRipFile, output_path: str) -> None:
+    """WebVTT is SubRip with a header, no cue numbers and '.' as the millisecond separator."""
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for item in subs:
+            f.write(f"{str(item.start).replace(',', '.')} --> {str(item.end).replace(',', '.')}\n{item.text}\n\n")
+
+
+def export_caption_sidecars(
+    transcription: List[Dict],
+    video_path: str,
+    formats: tuple = SIDECAR_FORMATS,
+    max_words_per_caption: int = MAX_WORDS_PER_CAPTION,
+    time_scale: float = 1.0,
+    start_delay: float = 0.0,
+    duration_adjust: float = 0.0,
+    per_caption_offset: Optional[Dict[int, float]] = None
+) -> List[str]:
+    """
+    Write the captions add_captions_to_video would burn in (same grouping and
+    timing options) as .srt/.vtt files next to video_path. Returns the paths.
+    """
+    captions = group_captions(transcription, max_words_per_caption, time_scale, start_delay,
+                              duration_adjust, per_caption_offset)
+    subs = captions_to_srt(captions)
+    base, _ = os.path.splitext(video_path)
+    paths = []
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        if fmt == "srt":
+            subs.save(path, encoding="utf-8")
+        elif fmt == "vtt":
+            write_webvtt(subs, path)
+        else:
+            raise ValueError(f"Unknown caption sidecar format '{fmt}'. Choose from: {', '.join(SIDECAR_FORMATS)}")
+        paths.append(path)
+    return paths
+
+
+def add_captions_to_video(
+    input_video_path: str,
+    transcription: List[Dict],
+    output_video_path: str,
+    font_path: Optional[str] = None,
+    fontsize: int = CAPTION_SETTINGS.get('TEXT_SIZE',24),
+    color: str = CAPTION_SETTINGS.get('COLOR','white'),
+    stroke_color: str = CAPTION_SETTINGS.get('STROKE_COLOR','black'),
+    stroke_width: int = CAPTION_SETTINGS.get('STROKE_WIDTH',2),
+    position: tuple = ('center', CAPTION_SETTINGS.get('CAPTION_POSITION', ('center', 1240))[1]),
+    blur_radius: int = 0,
+    opacity: float = 1.0,
+    bg_color: str = 'transparent',
+    max_words_per_caption: int = MAX_WORDS_PER_CAPTION,
+    time_scale: float = 1.0,
+    start_delay: float = 0.0,
+    duration_adjust: float = 0.0,
+    per_caption_offset: Optional[Dict[int, float]] = None,
+    profile: str = "final",
+    style: str = CAPTION_SETTINGS.get('STYLE', 'block')  # "block" or "karaoke" (word highlight)
+):
+    # Caption sizes and positions are authored for VIDEO_SIZE; scale them for drafts
+    render = get_profile(profile)
+    fontsize = scale_value(fontsize, render['scale'])
+    stroke_width = max(1, scale_value(stroke_width, render['scale'])) if stroke_width else 0
+    blur_radius = scale_value(blur_radius, render['scale'])
+    position = scale_position(position, render['scale'])
+    effects = caption_effects(render['scale'])
+
+    # Load the video
+    try:
+        video = VideoFileClip(input_video_path)
+    except Exception as e:
+        print(f"Error loading video file: {e}")
+        return
+
+    # Use default font if not provided
+    if font_path is None:
+        try:
+            font_path = get_default_font()
+        except FileNotFoundError as e:
+            print(e)
+            return
+
+    # Check if the font file exists
+    if not os.path.isfile(font_path):
+        print(f"Font file not found at {font_path}. Please provide a valid font file.")
+        return
+
+    # Define maximum width for captions (90% of video width)
+    max_caption_width = int(video.w * CAPTION_SETTINGS.get('SUBTITLE_MAX_WIDTH', 0.8))
+
+    # Group words into timed captions (shared with the sidecar export)
+    captions = group_captions(transcription, max_words_per_caption, time_scale, start_delay,
+                              duration_adjust, per_caption_offset)
+
     # Process captions to handle multi-line text
     processed_captions = []
     for idx, caption in enumerate(captions):
@@ -228,90 +366,81 @@ def add_captions_to_video(
         start = caption["start"]
         end = caption["end"]
 
-        lines = []
-        words = text.split()
-        current_line = ""
-
-        for word in words:
-            tentative_line = f"{current_line} {word}".strip()
-            # Check if adding the word keeps the line within width
-            if does_text_fit(tentative_line, fontsize, font_path, max_caption_width):
-                current_line = tentative_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                # Check if the single word fits
-                if does_text_fit(word, fontsize, font_path, max_caption_width):
-                    current_line = word
-                else:
-                    # Split the long word
-                    split_words = split_long_word(word)
-                    for split_word in split_words:
-                        if does_text_fit(split_word, fontsize, font_path, max_caption_width):
-                            lines.append(split_word)
-                        else:
-                            print(f"Word '{split_word}' is too long to fit even on a new line. Skipping.")
-                    current_line = ""
-        if current_line:
-            lines.append(current_line)
+        # Measured with cached glyph metrics; over-long words are hyphenated to fit
+        lines = layout_lines(text, font_path, fontsize, max_caption_width, stroke_width=stroke_width,
+                             balanced=CAPTION_SETTINGS.get('LINE_BREAKING', 'balanced') == 'balanced')
 
         # Combine lines with line breaks
         multi_line_text = "\n".join(lines)
         processed_captions.append({
             "start": start,
             "end": end,
-            "text": multi_line_text
+            "text": multi_line_text,
+            "words": caption["words"]
         })
 
-    # Create TextClips for all captions
+    # Rasterize all captions in-process (cached by text and style)
     text_clips = []
+    fade_in = CAPTION_SETTINGS.get('FADE_IN_DURATION', 0)
+    fade_out = CAPTION_SETTINGS.get('FADE_OUT_DURATION', 0)
     for idx, caption in enumerate(processed_captions):
         text = caption["text"]
         start = caption["start"]
         duration = caption["end"] - caption["start"]
 
-        # Create the TextClip with multi-line support
+        if style == 'karaoke':
+            # Caption and highlighted words are assembled from a glyph atlas built once per font and size
+            try:
+                txt_clip = karaoke_clip(
+                    caption["words"], font_path, fontsize, max_caption_width,
+                    color=color,
+                    stroke_color=stroke_color,
+                    stroke_width=stroke_width,
+                    highlight_color=tuple(CAPTION_SETTINGS.get('HIGHLIGHT_COLOR', (255, 220, 0))),
+                    highlight_scale=CAPTION_SETTINGS.get('HIGHLIGHT_SCALE', 1.15),
+                    balanced=CAPTION_SETTINGS.get('LINE_BREAKING', 'balanced') == 'balanced',
+                    fade_in=fade_in,
+                    fade_out=fade_out,
+                    **effects,
+                )
+            except OSError as e:
+                print(f"Error rendering caption '{text}': {e}")
+                continue
+            text_clips.append(txt_clip.set_position(position))
+            continue
+
         try:
-            txt_clip = TextClip(
-                txt=text,
-                fontsize=fontsize,
+            rgba = render_text(
+                text, font_path, fontsize,
                 color=color,
-                font=font_path,
                 stroke_color=stroke_color,
                 stroke_width=stroke_width,
-                method='caption',  # Use 'caption' to handle multi-line text
-                size=(max_caption_width, None),  # Width fixed, height auto
-                align='center'  # Center align the text
+                # A background box hugs the text; otherwise the width is fixed, height auto
+                width=None if effects['bg_color'] is not None else max_caption_width,
+                align='center',
+                opacity=opacity,
+                blur_radius=blur_radius,
+                **effects,
             )
-        except Exception as e:
-            print(f"Error creating TextClip for caption '{text}': {e}")
+        except OSError as e:
+            print(f"Error rendering caption '{text}': {e}")
             continue
-
-        # Apply opacity if needed
-        if opacity < 1.0:
-            txt_clip = txt_clip.set_opacity(opacity)
-
-        # Apply blur if needed
-        if blur_radius > 0:
-            try:
-                pil_img = moviepy_to_pillow(txt_clip)
-                pil_img_blurred = pil_img.filter(ImageFilter.GaussianBlur(radius=blur_radius))
-                blurred_array = np.array(pil_img_blurred)
-                txt_clip = ImageClip(blurred_array).set_duration(duration)
-            except Exception as e:
-                print(f"Error applying blur to caption '{text}': {e}")
+        # Box, shadow, glow and blur are all baked into one premultiplied sprite
+        txt_clip = text_clip(rgba, fade_in=fade_in, fade_out=fade_out)
 
         # Position the caption
         txt_clip = txt_clip.set_position(position).set_start(start).set_duration(duration)
 
         text_clips.append(txt_clip)
 
-    # Overlay all TextClips on the video
-    final_video = CompositeVideoClip([video] + text_clips)
+    # Overlay all caption clips on the video
+    final_video = TimelineCompositor(text_clips, bg_clip=video)
 
     # Write the final video to the output path
     try:
-        final_video.write_videofile(output_video_path, codec="libx264", audio_codec="aac")
+        # Frames go straight to ffmpeg; the source audio is stream-copied
+        write_clip(final_video, output_video_path, video.fps, preset=render['preset'],
+                   audio_path=input_video_path, audio_codec="copy")
     except Exception as e:
         print(f"Error writing output video: {e}")
 
@@ -0,0 +1,178 @@
+import math
+import numpy as np
+from moviepy.editor import VideoClip, CompositeAudioClip
+
+# -------------------- Interval Index --------------------
+DEFAULT_BUCKET_SECONDS = 1.0
+
+
+class IntervalIndex:
+    """
+    Fixed-width time buckets listing the intervals that overlap them, so a
+    lookup only checks the handful of intervals near t instead of all of them.
+    """
+
+    def __init__(self, intervals, bucket=DEFAULT_BUCKET_SECONDS):
+        self.intervals = list(intervals)
+        self.bucket = bucket
+        self.buckets = {}
+        for idx, (start, end) in enumerate(self.intervals):
+            first = math.floor(start / bucket)
+            last = math.floor(max(start, end - 1e-9) / bucket)
+            for b in range(first, last + 1):
+                self.buckets.setdefault(b, []).append(idx)
+
+    def active(self, t):
+        """Indices (in insertion order) of intervals with start <= t < end."""
+        candidates = self.buckets.get(math.floor(t / self.bucket), ())
+        return [idx for idx in candidates if self.intervals[idx][0] <= t < self.intervals[idx][1]]
+
+
+# -------------------- Sprites --------------------
+def resolve_position(pos, frame_size, clip_size, relative=False):
+    """MoviePy-style clip position (numbers or 'left'/'center'/...) -> integer (x, y)."""
+    (wf, hf), (wi, hi) = frame_size, clip_size
+    if isinstance(pos, str):
+        pos = {'center': ['center', 'center'], 'left': ['left', 'center'], 'right': ['right', 'center'],
+               'top': ['center', 'top'], 'bottom': ['center', 'bottom']}[pos]
+    else:
+        pos = list(pos)
+    if relative:
+        pos = [dim * p if not isinstance(p, str) else p for p, dim in zip(pos, (wf, hf))]
+    if isinstance(pos[0], str):
+        pos[0] = {'left': 0, 'center': (wf - wi) / 2, 'right': wf - wi}[pos[0]]
+    if isinstance(pos[1], str):
+        pos[1] = {'top': 0, 'center': (hf - hi) / 2, 'bottom': hf - hi}[pos[1]]
+    return int(pos[0]), int(pos[1])
+
+
+class Sprite:
+    """
+    An RGBA image stored premultiplied, so blitting it is one integer
+    multiply-add per pixel: dst = src + dst * (255 - a) / 255.
+    """
+
+    def __init__(self, rgba):
+        rgba = np.asarray(rgba)
+        alpha = rgba[..., 3:4].astype(np.uint16)
+        self.alpha = alpha
+        self.premultiplied = ((rgba[..., :3] * alpha + 127) // 255).astype(np.uint8)
+        self.inverse_alpha = 255 - alpha
+        self.scratch = np.empty(rgba.shape[:2] + (3,), dtype=np.uint16)
+        self.size = (rgba.shape[1], rgba.shape[0])
+
+    def blit(self, frame, x, y, gain=1.0, width=None):
+        """
+        Composite into a writable (H, W, 3) frame (values 0-255) at (x, y), in
+        place; width limits the blit to the sprite's first `width` columns.
+        """
+        frame_h, frame_w = frame.shape[:2]
+        w, h = self.size
+        if width is not None:
+            w = min(w, int(width))
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, frame_w), min(y + h, frame_h)
+        if x1 <= x0 or y1 <= y0 or gain <= 0:
+            return frame
+        sprite = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        src, inverse = self.premultiplied[sprite], self.inverse_alpha[sprite]
+        if gain < 1.0:
+            src = (src * gain).astype(np.uint8)
+            inverse = 255 - (self.alpha[sprite] * gain).astype(np.uint16)
+
+        region = frame[y0:y1, x0:x1]
+        acc = self.scratch[sprite]
+        np.multiply(region, inverse, out=acc, casting="unsafe")
+        acc += 128
+        acc += acc >> 8
+        acc >>= 8  # Exact rounded division by 255 for 0..65025
+        acc += src
+        np.minimum(acc, 255, out=acc)
+        np.copyto(region, acc, casting="unsafe")
+        return frame
+
+
+class SpriteClip(VideoClip):
+    """
+    A still RGBA image (e.g. a styled caption) blitted as a premultiplied
+    Sprite. However many effects were baked into the image, the per-frame
+    cost is the same. Optional fades scale alpha over the first/last seconds.
+    """
+
+    def __init__(self, rgba, fade_in=0, fade_out=0):
+        VideoClip.__init__(self)
+        self.sprite = Sprite(rgba)
+        self.size = self.sprite.size
+        self.fade_in, self.fade_out = fade_in, fade_out
+        self.make_frame = lambda t: self.sprite.premultiplied
+
+    def gain(self, ct):
+        """Fade multiplier at clip time ct."""
+        gain = 1.0
+        if self.fade_in > 0:
+            gain = min(gain, ct / self.fade_in)
+        if self.fade_out > 0 and self.duration is not None:
+            gain = min(gain, (self.duration - ct) / self.fade_out)
+        return min(max(gain, 0.0), 1.0)
+
+    def blit_into(self, frame, t):
+        """Composite the clip's frame at time t into a writable frame in place."""
+        ct = t - self.start
+        x, y = resolve_position(self.pos(ct), (frame.shape[1], frame.shape[0]), self.size, self.relative_pos)
+        return self.sprite.blit(frame, x, y, self.gain(ct))
+
+    def blit_on(self, picture, t):
+        return self.blit_into(np.array(picture), t)
+
+
+# -------------------- Compositor --------------------
+class TimelineCompositor(VideoClip):
+    """
+    Drop-in for CompositeVideoClip over many timed clips: clips are blitted in
+    list order over bg_clip (or a solid bg_color), but each frame only visits
+    the clips the interval index reports as live at that time.
+    """
+
+    def __init__(self, clips, size=None, bg_clip=None, bg_color=(0, 0, 0), bucket=DEFAULT_BUCKET_SECONDS):
+        VideoClip.__init__(self)
+        self.clips = clips
+        self.bg = bg_clip
+        self.size = tuple(size or (bg_clip.size if bg_clip is not None else clips[0].size))
+
+        ends = [c.end for c in clips]
+        if bg_clip is not None and bg_clip.duration is not None:
+            ends.append(bg_clip.duration)
+        if ends and None not in ends:
+            self.duration = self.end = max(ends)
+        fpss = [c.fps for c in clips + ([bg_clip] if bg_clip is not None else []) if getattr(c, 'fps', None)]
+        self.fps = max(fpss) if fpss else None
+
+        audioclips = [c.audio for c in ([bg_clip] if bg_clip is not None else []) + clips if c.audio is not None]
+        if audioclips:
+            self.audio = CompositeAudioClip(audioclips)
+
+        horizon = self.duration if self.duration is not None else float('inf')
+        self.index = IntervalIndex([(c.start, c.end if c.end is not None else horizon) for c in clips], bucket)
+
+        w, h = self.size
+        background = np.zeros((h, w, 3), dtype=np.uint8)
+        background[:] = bg_color
+
+        def make_frame(t):
+            frame = self.bg.get_frame(t) if self.bg is not None else background
+            active = self.index.active(t)
+            if not active:
+                return frame
+            frame = np.array(frame)  # One writable copy; sprites blit into it in place
+            for idx in active:
+                clip = self.clips[idx]
+                if isinstance(clip, SpriteClip):
+                    clip.blit_into(frame, t)
+                else:
+                    frame = clip.blit_on(frame, t)
+            return frame
+
+        self.make_frame = make_frame
+
+    def playing_clips(self, t=0):
+        """The clips live at time t, in compositing order."""
+        return [self.clips[idx] for idx in self.index.active(t)]
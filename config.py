@@ -25,6 +25,10 @@ LEONARDO_API_KEY = os.getenv('LEONARDO_API_KEY')
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
 FREESOUND_API_KEY = os.getenv('FREESOUND_API_KEY')
 
+# Transcription ("openai" hosted Whisper, or "local" CPU faster-whisper)
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'openai')
+LOCAL_WHISPER_MODEL = os.getenv('LOCAL_WHISPER_MODEL', 'base')
+
 # Video Settings
 VIDEO_WIDTH = 1080
 VIDEO_HEIGHT = 1920
@@ -32,6 +36,14 @@ VIDEO_SIZE = (VIDEO_WIDTH, VIDEO_HEIGHT)
 FPS = 24
 SCRIPT_DURATION_SECONDS = 59
 
+# Render Profiles
+# "draft" renders a quick approval preview; everything upstream of the encode
+# (script, images, narration, audio mix) is shared with the final render.
+RENDER_PROFILES = {
+    "final": {"scale": 1.0, "fps": FPS, "preset": "medium"},
+    "draft": {"scale": 0.5, "fps": 12, "preset": "ultrafast"},
+}
+
 # Caption Settings
 CAPTION_SETTINGS = {
     "TEXT_SIZE": 85,
@@ -42,6 +54,10 @@ CAPTION_SETTINGS = {
     "METHOD": 'caption',
     "CAPTION_POSITION": (120, 1240),
     "SUBTITLE_MAX_WIDTH": 0.8,
+    "LINE_BREAKING": "balanced",  # "balanced" (even line widths) or "greedy"
+    "STYLE": "block",  # "block" (whole caption) or "karaoke" (active word highlighted)
+    "HIGHLIGHT_COLOR": (255, 220, 0),
+    "HIGHLIGHT_SCALE": 1.15,
     "ENABLE_BACKGROUND_BOX": True,
     "BACKGROUND_COLOR": (0, 0, 0),
     "BACKGROUND_OPACITY": 0.5,
@@ -50,10 +66,34 @@ CAPTION_SETTINGS = {
     "ROUND_CORNER_RADIUS": 30,
     "BACKGROUND_BOX_POSITION": (120, 1150),
     "CUSTOM_BOX_POSITION_OFFSET": (0, 0),
+    "ENABLE_SHADOW": False,
+    "SHADOW_OFFSET": (6, 6),
+    "SHADOW_BLUR": 4,
+    "SHADOW_COLOR": (0, 0, 0),
+    "SHADOW_OPACITY": 0.6,
+    "ENABLE_GLOW": False,
+    "GLOW_RADIUS": 8,
+    "GLOW_COLOR": (255, 255, 255),
+    "GLOW_OPACITY": 0.5,
     "FADE_IN_DURATION": 0,
     "FADE_OUT_DURATION": 0,
 }
 
+# Overlay Layers (see overlay.LAYER_DEFAULTS for every option)
+# Composited in order in one pass over the captioned video; when all enabled
+# layers sit in the opening/closing seconds only those GOPs are re-encoded.
+OVERLAY_LAYERS = [
+    {"type": "text", "text": "Comment Below: Your Idea Could Be Next!", "start": 0, "duration": 5,
+     "fontsize": 75, "position": (20, 300), "bg_color": (0, 0, 0), "bg_opacity": 0.3, "padding": 5,
+     "fade_in": 1, "fade_out": 1},
+    {"type": "text", "text": "Want to see your idea here? Comment Below!", "start": -5, "duration": 5,
+     "fontsize": 75, "position": (20, 1500), "bg_color": (0, 0, 0), "bg_opacity": 0.3, "padding": 5,
+     "fade_in": 1, "fade_out": 1},
+    {"type": "section_titles", "enabled": False},
+    {"type": "image", "path": "logo.png", "position": (900, 40), "width": 140, "opacity": 0.8, "enabled": False},
+    {"type": "progress", "height": 12, "color": (255, 255, 255), "opacity": 0.8, "enabled": False},
+]
+
 # Leonardo AI Configuration
 LEONARDO_MODEL_ID = "b24e16ff-06e3-43eb-8d33-4416c2d75876"
 LEONARDO_WIDTH = 864
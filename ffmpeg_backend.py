@@ -0,0 +1,197 @@
+import subprocess
+from moviepy.config import get_setting
+from config import VIDEO_SIZE, FPS
+from transitions import resolve_transition
+
+# -------------------- Configuration --------------------
+AUDIO_RATE = 44100
+ZOOMPAN_OVERSAMPLE = 2  # Upscale before zoompan so sub-pixel motion does not jitter
+PAN_AMOUNT = 0.05
+
+# ffmpeg expression versions of kenburns.EASINGS; U is the 0..1 progress
+EASING_EXPRESSIONS = {
+    "linear": "({u})",
+    "ease_in": "(({u})*({u}))",
+    "ease_out": "(1-(1-({u}))*(1-({u})))",
+    "ease_in_out": "(0.5-0.5*cos(PI*({u})))",
+}
+
+# xfade equivalents of transitions.TRANSITIONS; other names pass through to xfade
+XFADE_NAMES = {
+    "crossfade": "fade",
+    "slide": "slideleft",
+    "zoom_through": "zoomin",
+    "glimmer": "fadewhite",
+}
+
+PAN_VECTORS = {
+    "none": (0, 0), "left": (-1, 0), "right": (1, 0), "up": (0, -1), "down": (0, 1),
+    "up_left": (-1, -1), "up_right": (1, -1), "down_left": (-1, 1), "down_right": (1, 1),
+}
+
+
+def ffmpeg_binary():
+    """Path of the ffmpeg executable MoviePy is configured with."""
+    return get_setting("FFMPEG_BINARY")
+
+
+def eased(expr, easing):
+    """Wrap a progress expression in the named easing curve."""
+    return EASING_EXPRESSIONS.get(easing, EASING_EXPRESSIONS["ease_in_out"]).format(u=expr)
+
+
+def zoompan_filter(label_in, label_out, frames, size, fps, zoom, zoom_mode, easing, pan):
+    """
+    Ken Burns for one still: scale once, then zoompan emits `frames` output frames.
+    Mirrors kenburns.KenBurns (zoom modes, easing, pan into the spare margin).
+    """
+    w, h = size
+    last = max(frames - 1, 1)
+    progress = f"on/{last}"
+    if zoom_mode == "in":
+        zoom_u = progress
+    elif zoom_mode == "out":
+        zoom_u = f"1-{progress}"
+    else:
+        zoom_u = f"1-abs(2*{progress}-1)"
+    dx, dy = PAN_VECTORS.get(pan, (0, 0))
+    base = 1 + (2 * PAN_AMOUNT if (dx, dy) != (0, 0) else 0)
+    z = f"{base}+{zoom}*{eased(zoom_u, easing)}"
+    pan_p = eased(progress, easing)
+    x = f"(iw-iw/zoom)/2*(1+{dx}*(2*{pan_p}-1))"
+    y = f"(ih-ih/zoom)/2*(1+{dy}*(2*{pan_p}-1))"
+    return (
+        f"[{label_in}]scale={w * ZOOMPAN_OVERSAMPLE}:{h * ZOOMPAN_OVERSAMPLE},setsar=1,"
+        f"zoompan=z='{z}':x='{x}':y='{y}':d={frames}:s={w}x{h}:fps={fps},"
+        f"setsar=1,format=yuv420p[{label_out}]"
+    )
+
+
+def build_filtergraph(segments, total_duration, size=VIDEO_SIZE, fps=FPS, bg_music=None, bg_volume=0.1,
+                      transition_volume=0.1, transition_fade=0.15, transition_offset=0.1,
+                      zoom=0.1, zoom_mode="in_out", zoom_easing="ease_in_out", visual_transition="fade"):
+    """
+    Compile a resolved timeline into ffmpeg input arguments and one filter_complex.
+
+    Each segment is a dict with start, duration, image, audio and transition
+    (paths may be None). visual_transition "fade" fades each segment through
+    black like the MoviePy path; "auto" picks each cut's transition from the
+    segment's transition_effect; transitions.TRANSITIONS names map to their
+    xfade equivalents, and any other value is used as an xfade transition
+    (e.g. "slideleft", "circleopen") overlapping neighbouring segments.
+
+    Returns:
+        tuple: (input_args, filter_complex, video_label, audio_label)
+    """
+    inputs, filters = [], []
+    w, h = size
+    use_xfade = visual_transition != "fade"
+
+    def add_input(path, loop=False):
+        if loop:
+            inputs.extend(["-stream_loop", "-1"])
+        inputs.extend(["-i", path])
+        return len([a for a in inputs if a == "-i"]) - 1
+
+    # Video: one zoompan chain per segment, frame counts taken from the
+    # cumulative timeline so rounding never drifts against the audio
+    video_labels = []
+    for idx, seg in enumerate(segments):
+        start_frame = round(seg["start"] * fps)
+        end_frame = round((seg["start"] + seg["duration"]) * fps)
+        frames = max(1, end_frame - start_frame)
+        if use_xfade and idx < len(segments) - 1:
+            frames += round(transition_fade * fps)  # Overlap consumed by the next xfade
+        label = f"v{idx}"
+        if seg.get("image"):
+            in_idx = add_input(seg["image"])
+            filters.append(zoompan_filter(
+                f"{in_idx}:v", label, frames, size, fps, zoom, zoom_mode, zoom_easing, seg.get("pan", "none")
+            ))
+        else:
+            filters.append(f"color=c=black:s={w}x{h}:r={fps}:d={frames / fps},format=yuv420p[{label}]")
+        if not use_xfade and transition_fade > 0:
+            seg_dur = frames / fps
+            filters.append(
+                f"[{label}]fade=t=in:st=0:d={transition_fade},"
+                f"fade=t=out:st={max(seg_dur - transition_fade, 0)}:d={transition_fade}[{label}f]"
+            )
+            label = f"{label}f"
+        video_labels.append(label)
+
+    if use_xfade and len(video_labels) > 1:
+        current = video_labels[0]
+        for idx in range(1, len(video_labels)):
+            out = f"x{idx}"
+            kind = resolve_transition(visual_transition, segments[idx].get("transition_effect"))
+            filters.append(
+                f"[{current}][{video_labels[idx]}]xfade=transition={XFADE_NAMES.get(kind, kind)}:"
+                f"duration={transition_fade}:offset={segments[idx]['start']}[{out}]"
+            )
+            current = out
+        video_out = current
+    else:
+        filters.append("".join(f"[{l}]" for l in video_labels) + f"concat=n={len(video_labels)}:v=1:a=0[vcat]")
+        video_out = "vcat"
+
+    # Audio: narration and transition SFX placed with adelay, music looped and trimmed
+    norm = f"aresample={AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo"
+    audio_labels = []
+    for idx, seg in enumerate(segments):
+        if seg.get("audio"):
+            in_idx = add_input(seg["audio"])
+            delay = int(round(seg["start"] * 1000))
+            filters.append(f"[{in_idx}:a]{norm},adelay={delay}:all=1[n{idx}]")
+            audio_labels.append(f"n{idx}")
+        if seg.get("transition"):
+            in_idx = add_input(seg["transition"], loop=True)
+            delay = int(round(max(seg["start"] + seg["duration"] - transition_offset, 0) * 1000))
+            filters.append(
+                f"[{in_idx}:a]atrim=0:{transition_fade},asetpts=PTS-STARTPTS,{norm},"
+                f"volume={transition_volume},afade=t=out:st=0:d={transition_fade},"
+                f"adelay={delay}:all=1[t{idx}]"
+            )
+            audio_labels.append(f"t{idx}")
+    if bg_music:
+        in_idx = add_input(bg_music, loop=True)
+        filters.append(
+            f"[{in_idx}:a]atrim=0:{total_duration},asetpts=PTS-STARTPTS,{norm},volume={bg_volume}[bg]"
+        )
+        audio_labels.append("bg")
+
+    if audio_labels:
+        filters.append(
+            "".join(f"[{l}]" for l in audio_labels)
+            + f"amix=inputs={len(audio_labels)}:duration=longest:dropout_transition=0:normalize=0,"
+            f"apad=whole_dur={total_duration},atrim=0:{total_duration}[aout]"
+        )
+    else:
+        filters.append(f"anullsrc=r={AUDIO_RATE}:cl=stereo,atrim=0:{total_duration}[aout]")
+
+    return inputs, ";".join(filters), video_out, "aout"
+
+
+def render_timeline_ffmpeg(segments, output_path, total_duration, size=VIDEO_SIZE, fps=FPS,
+                           preset="medium", **graph_options):
+    """
+    Render the whole timeline (video, narration, SFX and music) in one ffmpeg run.
+    Returns the output path, or None if ffmpeg failed.
+    """
+    inputs, graph, video_label, audio_label = build_filtergraph(
+        segments, total_duration, size=size, fps=fps, **graph_options
+    )
+    cmd = [
+        ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+        *inputs,
+        "-filter_complex", graph,
+        "-map", f"[{video_label}]", "-map", f"[{audio_label}]",
+        "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-r", str(fps),
+        "-c:a", "aac", "-t", f"{total_duration:.3f}",
+        str(output_path),
+    ]
+    print(f"[VERBOSE] ffmpeg filtergraph render: {len(segments)} segments, {len(graph)} chars of filters")
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"[ERROR] ffmpeg render failed: {result.stderr.decode(errors='replace')[-2000:]}")
+        return None
+    return str(output_path)
@@ -0,0 +1,136 @@
+import subprocess
+import numpy as np
+from moviepy.config import get_setting
+
+# -------------------- Colorspace --------------------
+# BT.601 limited-range coefficients in 8-bit fixed point, matching what
+# ffmpeg's swscale does by default for rgb24 -> yuv420p
+Y_COEFFS = (66, 129, 25)
+U_COEFFS = (-38, -74, 112)
+V_COEFFS = (112, -94, -18)
+# rgb24 leaves the colorspace conversion to ffmpeg's SIMD swscale; yuv420p
+# halves pipe bandwidth by converting here, which pays off when the encoder
+# runs on other cores than the renderer (on one core, NumPy is the slower side)
+PIPE_PIXEL_FORMAT = "rgb24"
+# Seconds between forced keyframes: short GOPs let later passes (see
+# smart_render) re-encode just the seconds they change and copy the rest
+KEYFRAME_INTERVAL = 2
+
+
+class FrameWriter:
+    """
+    Stream frames to an ffmpeg encoder through one preallocated buffer.
+
+    With pix_fmt="yuv420p" each RGB frame is converted in place with
+    fixed-point NumPy into the buffer's Y/U/V planes (1.5 bytes per pixel
+    instead of 3), and the buffer itself is handed to the pipe, so no
+    per-frame bytes objects are created. pix_fmt="rgb24" pipes frames as-is.
+    audio_path may be any media file; its first audio stream is muxed in.
+    """
+
+    def __init__(self, output_path, size, fps, preset="medium", pix_fmt=PIPE_PIXEL_FORMAT,
+                 audio_path=None, audio_codec="aac", duration=None):
+        self.width, self.height = (int(v) for v in size)
+        if pix_fmt == "yuv420p" and (self.width % 2 or self.height % 2):
+            raise ValueError(f"yuv420p needs even dimensions, got {self.width}x{self.height}")
+        self.pix_fmt = pix_fmt
+        self.output_path = str(output_path)
+        w, h = self.width, self.height
+
+        if pix_fmt == "yuv420p":
+            self.buffer = np.empty(w * h * 3 // 2, dtype=np.uint8)
+            self.y_plane = self.buffer[:w * h].reshape(h, w)
+            self.u_plane = self.buffer[w * h:w * h * 5 // 4].reshape(h // 2, w // 2)
+            self.v_plane = self.buffer[w * h * 5 // 4:].reshape(h // 2, w // 2)
+            self.luma = np.empty((h, w), dtype=np.int32)
+            self.term = np.empty((h, w), dtype=np.int32)
+            self.chroma = np.empty((3, h // 2, w // 2), dtype=np.int32)
+            self.chroma_acc = np.empty((h // 2, w // 2), dtype=np.int32)
+            self.chroma_term = np.empty((h // 2, w // 2), dtype=np.int32)
+        else:
+            self.buffer = np.empty((h, w, 3), dtype=np.uint8)
+
+        cmd = [
+            get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+            "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+        ]
+        if audio_path:
+            cmd += ["-i", str(audio_path), "-map", "0:v", "-map", "1:a:0?", "-c:a", audio_codec]
+        cmd += ["-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-r", str(fps),
+                "-g", str(max(1, int(round(fps * KEYFRAME_INTERVAL))))]
+        if duration:
+            cmd += ["-t", f"{duration:.3f}"]
+        cmd += ["-movflags", "+faststart", self.output_path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def to_yuv420(self, rgb):
+        """Convert an (H, W, 3) uint8 frame into the buffer's Y, U and V planes."""
+        channels = (rgb[..., 0], rgb[..., 1], rgb[..., 2])
+
+        # Luma at full resolution: ((66R + 129G + 25B + 128) >> 8) + 16
+        np.multiply(channels[0], Y_COEFFS[0], out=self.luma, dtype=np.int32)
+        for channel, coeff in zip(channels[1:], Y_COEFFS[1:]):
+            np.multiply(channel, coeff, out=self.term, dtype=np.int32)
+            self.luma += self.term
+        self.luma += 128
+        self.luma >>= 8
+        self.luma += 16
+        np.copyto(self.y_plane, self.luma, casting="unsafe")
+
+        # Chroma from 2x2 block sums (4x the average, folded into the shift)
+        for acc, channel in zip(self.chroma, channels):
+            np.add(channel[0::2, 0::2], channel[1::2, 0::2], out=acc, dtype=np.int32)
+            acc += channel[0::2, 1::2]
+            acc += channel[1::2, 1::2]
+        for plane, coeffs in ((self.u_plane, U_COEFFS), (self.v_plane, V_COEFFS)):
+            np.multiply(self.chroma[0], coeffs[0], out=self.chroma_acc)
+            for acc, coeff in zip(self.chroma[1:], coeffs[1:]):
+                np.multiply(acc, coeff, out=self.chroma_term)
+                self.chroma_acc += self.chroma_term
+            self.chroma_acc += 512
+            self.chroma_acc >>= 10
+            self.chroma_acc += 128
+            np.copyto(plane, self.chroma_acc, casting="unsafe")
+
+    def write_frame(self, frame):
+        """Encode one (H, W, 3) RGB frame."""
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if self.pix_fmt == "yuv420p":
+            self.to_yuv420(frame)
+        else:
+            np.copyto(self.buffer, frame)
+        self.proc.stdin.write(memoryview(self.buffer))
+
+    def close(self):
+        """Finish the encode; raises if ffmpeg failed."""
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed writing {self.output_path}: "
+                               f"{self.proc.stderr.read().decode(errors='replace')}")
+        return self.output_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def write_clip(clip, output_path, fps, preset="medium", audio_path=None, audio_codec="aac",
+               pix_fmt=PIPE_PIXEL_FORMAT):
+    """
+    Render a MoviePy clip's frames through a FrameWriter. Audio is muxed from
+    audio_path (e.g. the source video or a premixed WAV) rather than re-rendered.
+    """
+    num_frames = int(round(clip.duration * fps))
+    print(f"[VERBOSE] Writing {num_frames} frames to {output_path}")
+    with FrameWriter(output_path, clip.size, fps, preset=preset, pix_fmt=pix_fmt,
+                     audio_path=audio_path, audio_codec=audio_codec, duration=clip.duration) as writer:
+        for n in range(num_frames):
+            writer.write_frame(clip.get_frame(n / fps))
+    return str(output_path)
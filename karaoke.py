@@ -0,0 +1,132 @@
+import bisect
+from functools import lru_cache
+from PIL import Image
+from compositor import Sprite, SpriteClip, resolve_position
+from text_layout import HYPHEN, layout_lines
+from text_render import LINE_SPACING, compose_effects, effect_margin, glyph_atlas, to_rgb
+
+# -------------------- Configuration --------------------
+HIGHLIGHT_COLOR = (255, 220, 0)
+HIGHLIGHT_SCALE = 1.15  # "Pop" size of the active word
+SPRITE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def word_sprite(text, font_path, size, stroke_width, color, stroke_color, shadow=None, glow=None):
+    """
+    Premultiplied sprite of one word assembled from the glyph atlas, with its
+    shadow and glow, and the (x, y) offset of the word's own origin in it.
+    """
+    rgba = glyph_atlas(font_path, size, stroke_width).render(text, color, stroke_color)
+    margin = effect_margin(shadow, glow)
+    layer = Image.new("RGBA", (rgba.shape[1] + 2 * margin, rgba.shape[0] + 2 * margin), (0, 0, 0, 0))
+    layer.paste(Image.fromarray(rgba), (margin, margin))
+    return Sprite(compose_effects(layer, margin, shadow=shadow, glow=glow)), margin
+
+
+def match_pieces(lines, words):
+    """
+    The (line, token) pieces each word was laid out as; layout_lines may
+    hyphenate a long word across several tokens.
+    """
+    tokens = [(li, ti, tok) for li, line in enumerate(lines) for ti, tok in enumerate(line.split(" "))]
+    pieces, k = [], 0
+    for word in words:
+        parts, matched = [], ""
+        while k < len(tokens) and matched != word:
+            li, ti, tok = tokens[k]
+            rest = word[len(matched):]
+            if rest.startswith(tok):
+                matched += tok
+            elif tok.endswith(HYPHEN) and rest.startswith(tok[:-1]):
+                matched += tok[:-1]
+            else:
+                break
+            parts.append((li, ti))
+            k += 1
+        pieces.append(parts)
+    return pieces
+
+
+# -------------------- Clip --------------------
+class KaraokeClip(SpriteClip):
+    """
+    A caption sprite plus pre-rendered highlight sprites for its words. Each
+    frame blits the caption and then the active word's highlight on top, so
+    the animation costs a couple of small blits however long the video is.
+
+    words: (start, end, [(dx, dy, Sprite), ...]) per word, in clip time, with
+    offsets relative to the caption's top-left corner.
+    """
+
+    def __init__(self, rgba, words, fade_in=0, fade_out=0):
+        SpriteClip.__init__(self, rgba, fade_in=fade_in, fade_out=fade_out)
+        self.words = words
+        self.word_starts = [start for start, _, _ in words]
+
+    def blit_into(self, frame, t):
+        ct = t - self.start
+        x, y = resolve_position(self.pos(ct), (frame.shape[1], frame.shape[0]), self.size, self.relative_pos)
+        gain = self.gain(ct)
+        self.sprite.blit(frame, x, y, gain)
+        idx = bisect.bisect_right(self.word_starts, ct) - 1
+        if idx >= 0 and ct < self.words[idx][1]:
+            for dx, dy, sprite in self.words[idx][2]:
+                sprite.blit(frame, x + dx, y + dy, gain)
+        return frame
+
+
+def karaoke_clip(words, font_path, fontsize, max_width, color="white", stroke_color=None, stroke_width=0,
+                 highlight_color=HIGHLIGHT_COLOR, highlight_scale=HIGHLIGHT_SCALE, bg_color=None,
+                 bg_opacity=0.0, padding=(0, 0), radius=0, shadow=None, glow=None, balanced=True,
+                 fade_in=0, fade_out=0):
+    """
+    Word-highlight caption for words ({"word", "start", "end"}, absolute
+    times). The clip starts at the first word and ends with the last; set its
+    position as for any caption. Every word sits centred in a slot sized for
+    its enlarged (highlighted) form, so the pop never covers its neighbours.
+    shadow and glow are drawn under the caption and the highlighted word.
+    """
+    start, end = words[0]["start"], words[-1]["end"]
+    pop_size = max(1, int(round(fontsize * highlight_scale)))
+    pop_stroke = int(round(stroke_width * highlight_scale))
+    # Lines are broken at the enlarged size so the reserved slots fit max_width
+    lines = layout_lines(" ".join(w["word"] for w in words), font_path, pop_size, max_width,
+                         stroke_width=pop_stroke, balanced=balanced)
+    atlas, pop = glyph_atlas(font_path, fontsize, stroke_width), glyph_atlas(font_path, pop_size, pop_stroke)
+    pitch = pop.height - 2 * pop_stroke + LINE_SPACING
+    rows = [line.split(" ") for line in lines]
+    row_widths = [sum(pop.width(tok) for tok in tokens) + int(round(pop.metrics.space)) * (len(tokens) - 1)
+                  for tokens in rows]
+    inner_w = max(row_widths)
+    inner_h = pitch * len(rows) - LINE_SPACING + 2 * pop_stroke
+    margin = effect_margin(shadow, glow)
+    pad_w, pad_h = padding[0] + margin, padding[1] + margin
+
+    # Slots (x, y, w, h) in canvas pixels, one per token; each normal-size word is centred in its slot
+    text_layer = Image.new("RGBA", (inner_w + 2 * pad_w, inner_h + 2 * pad_h), (0, 0, 0, 0))
+    slots = []
+    for li, (tokens, row_w) in enumerate(zip(rows, row_widths)):
+        x, y = pad_w + (inner_w - row_w) // 2, pad_h + li * pitch
+        row = []
+        for tok in tokens:
+            slot_w = pop.width(tok)
+            text_layer.alpha_composite(Image.fromarray(atlas.render(tok, color, stroke_color)),
+                                       (x + (slot_w - atlas.width(tok)) // 2, y + (pop.height - atlas.height) // 2))
+            row.append((x, y, slot_w, pop.height))
+            x += slot_w + int(round(pop.metrics.space))
+        slots.append(row)
+    canvas = compose_effects(text_layer, margin, bg_color, bg_opacity, radius, shadow, glow)
+
+    highlights = []
+    for word, parts in zip(words, match_pieces(lines, [w["word"] for w in words])):
+        sprites = []
+        for li, ti in parts:
+            x, y, _, _ = slots[li][ti]
+            sprite, offset = word_sprite(rows[li][ti], font_path, pop_size, pop_stroke,
+                                         to_rgb(highlight_color), stroke_color, shadow, glow)
+            sprites.append((x - offset, y - offset, sprite))
+        highlights.append((word["start"] - start, word["end"] - start, sprites))
+
+    clip = KaraokeClip(canvas, highlights, fade_in=fade_in, fade_out=fade_out)
+    return clip.set_start(start).set_duration(end - start)
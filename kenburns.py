@@ -0,0 +1,111 @@
+import math
+import numpy as np
+from PIL import Image
+
+# -------------------- Resampling Kernels --------------------
+RESAMPLING = Image.Resampling if hasattr(Image, 'Resampling') else Image
+MOTION_RESAMPLE = RESAMPLING.BILINEAR  # Cheap kernel while the camera is moving
+STILL_RESAMPLE = RESAMPLING.BICUBIC    # Sharper kernel when the camera is (nearly) at rest
+PRESCALE_RESAMPLE = RESAMPLING.LANCZOS  # One-off, so quality wins
+STILL_VELOCITY = 0.002  # Zoom change per frame below which a frame counts as "at rest"
+
+# -------------------- Easing & Direction --------------------
+EASINGS = {
+    "linear": lambda u: u,
+    "ease_in": lambda u: u * u,
+    "ease_out": lambda u: 1 - (1 - u) * (1 - u),
+    "ease_in_out": lambda u: 0.5 - 0.5 * math.cos(math.pi * u),
+}
+
+PAN_DIRECTIONS = {
+    "none": (0, 0),
+    "left": (-1, 0),
+    "right": (1, 0),
+    "up": (0, -1),
+    "down": (0, 1),
+    "up_left": (-1, -1),
+    "up_right": (1, -1),
+    "down_left": (-1, 1),
+    "down_right": (1, 1),
+}
+
+ZOOM_MODES = ("in", "out", "in_out")
+
+
+class KenBurns:
+    """
+    Zoom/pan camera over a still image that only ever computes the output-sized crop.
+
+    The source is pre-scaled once to the maximum magnification, so each frame is
+    a single scale+translate sample of the visible box (Pillow's separable
+    resampler) straight into an output-sized image.
+    """
+
+    def __init__(self, image, output_size, duration, zoom=0.1, zoom_mode="in_out",
+                 pan="none", pan_amount=0.05, easing="ease_in_out", fps=None):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        self.output_size = tuple(int(v) for v in output_size)
+        self.duration = max(float(duration), 1e-6)
+        self.zoom = max(0.0, float(zoom))
+        self.zoom_mode = zoom_mode if zoom_mode in ZOOM_MODES else "in_out"
+        self.direction = PAN_DIRECTIONS.get(pan, (0, 0))
+        self.ease = EASINGS.get(easing, EASINGS["ease_in_out"])
+        self.frame_step = 1.0 / fps if fps else None
+
+        # Panning needs spare image around the crop even at minimum zoom
+        self.base_factor = 1.0 + (2 * pan_amount if self.direction != (0, 0) else 0.0)
+        max_factor = self.base_factor + self.zoom
+        out_w, out_h = self.output_size
+        src_size = (max(out_w, round(out_w * max_factor)), max(out_h, round(out_h * max_factor)))
+        self.source = image.convert("RGB").resize(src_size, PRESCALE_RESAMPLE)
+        self.static_frame = None
+        if max_factor == 1.0:
+            self.static_frame = np.asarray(self.source)
+
+    def factor(self, t):
+        """
+        Magnification at time t, relative to fitting the whole source in the output.
+        """
+        p = min(max(t / self.duration, 0.0), 1.0)
+        if self.zoom_mode == "in":
+            u = p
+        elif self.zoom_mode == "out":
+            u = 1.0 - p
+        else:
+            u = 1.0 - abs(2.0 * p - 1.0)
+        return self.base_factor + self.zoom * self.ease(u)
+
+    def frame(self, t):
+        """
+        Return the (H, W, 3) uint8 output frame at time t.
+        """
+        if self.static_frame is not None:
+            return self.static_frame
+
+        src_w, src_h = self.source.size
+        factor = self.factor(t)
+
+        # Visible region in source pixels; 1:1 at maximum magnification
+        crop_w = src_w / factor
+        crop_h = src_h / factor
+
+        # Pan progressively into the spare margin, clamped inside the source
+        p = self.ease(min(max(t / self.duration, 0.0), 1.0))
+        dx, dy = self.direction
+        margin_x = (src_w - crop_w) / 2
+        margin_y = (src_h - crop_h) / 2
+        cx = src_w / 2 + dx * margin_x * (2 * p - 1)
+        cy = src_h / 2 + dy * margin_y * (2 * p - 1)
+        x0 = min(max(cx - crop_w / 2, 0.0), src_w - crop_w)
+        y0 = min(max(cy - crop_h / 2, 0.0), src_h - crop_h)
+
+        resample = MOTION_RESAMPLE
+        if self.frame_step is not None:
+            velocity = abs(self.factor(t + self.frame_step) - factor)
+            if velocity < STILL_VELOCITY and (dx, dy) == (0, 0):
+                resample = STILL_RESAMPLE
+
+        # Scale + translate sample of just the visible box, straight to output size
+        box = (x0, y0, x0 + crop_w, y0 + crop_h)
+        return np.asarray(self.source.resize(self.output_size, resample, box=box))
@@ -1,6 +1,16 @@
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+from moviepy.editor import VideoFileClip, TextClip
 import os
 import sys
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+from config import BASE_DIR
+from render_profile import get_profile, scale_value, scale_position
+from compositor import Sprite, SpriteClip, TimelineCompositor, resolve_position
+from frame_writer import write_clip
+from smart_render import overlay_windows, smart_render
+from text_layout import layout_lines
+from text_render import render_text, text_clip, to_rgb
 
 def list_available_fonts():
     """Lists available fonts for TextClip."""
@@ -12,6 +22,183 @@ def list_available_fonts():
     except Exception as e:
         print(f"Error listing fonts: {e}")
 
+# -------------------- Layer Stack --------------------
+# Each layer is a dict with a "type" plus a time window: "start" in seconds
+# (negative counts back from the end of the video) and "duration" (None runs
+# to the end). Sizes and positions are authored for VIDEO_SIZE and scaled by
+# the render profile. Layers with "enabled": False are skipped.
+LAYER_DEFAULTS = {
+    "text": {"start": 0, "duration": None, "font": "Bangers-Regular.ttf", "fontsize": 75,
+             "position": ("center", "center"), "color": "white", "bg_color": None, "bg_opacity": 0.0,
+             "padding": 0, "fade_in": 0, "fade_out": 0},
+    "image": {"start": 0, "duration": None, "position": ("right", "top"), "width": None, "opacity": 1.0,
+              "fade_in": 0, "fade_out": 0},
+    "progress": {"start": 0, "duration": None, "position": "bottom", "height": 12, "color": (255, 255, 255),
+                 "opacity": 1.0, "track_color": None, "track_opacity": 0.3},
+    "section_titles": {"duration": 2.5, "font": "Bangers-Regular.ttf", "fontsize": 70, "position": ("center", 200),
+                       "color": "white", "bg_color": (0, 0, 0), "bg_opacity": 0.4, "padding": 10,
+                       "fade_in": 0.3, "fade_out": 0.3},
+}
+TEXT_MARGIN = 40  # Horizontal space left around wrapped overlay text
+
+
+def resolve_asset(path):
+    """Fonts and images may be given relative to the project directory."""
+    if not os.path.isabs(path) and not os.path.exists(path):
+        return str(BASE_DIR / path)
+    return path
+
+
+def layer_window(layer, video_duration):
+    """(start, duration) of a layer, clamped to the video."""
+    start = layer["start"]
+    if start < 0:
+        start = max(video_duration + start, 0)
+    duration = layer["duration"] if layer["duration"] is not None else video_duration - start
+    return start, max(min(duration, video_duration - start), 0)
+
+
+@lru_cache(maxsize=32)
+def image_rgba(path, width, opacity, stamp):
+    """A logo or watermark as a read-only RGBA array, resized and faded once (stamp is the file's mtime)."""
+    image = Image.open(path).convert("RGBA")
+    if width and width != image.width:
+        image = image.resize((int(width), max(1, int(round(image.height * width / image.width)))), Image.LANCZOS)
+    array = np.array(image)
+    if opacity < 1.0:
+        array[..., 3] = (array[..., 3] * opacity).astype(np.uint8)
+    array.flags.writeable = False
+    return array
+
+
+class ProgressBarClip(SpriteClip):
+    """
+    A bar that fills left to right over the clip's duration: the full bar is
+    a premultiplied sprite and each frame blits just its first columns (over
+    an optional track sprite), so drawing it is a single vectorized fill.
+    """
+
+    def __init__(self, width, height, color, opacity=1.0, track_color=None, track_opacity=0.3):
+        bar = np.zeros((height, width, 4), dtype=np.uint8)
+        bar[..., :3] = to_rgb(color)
+        bar[..., 3] = int(round(255 * opacity))
+        SpriteClip.__init__(self, bar)
+        self.track = None
+        if track_color is not None and track_opacity > 0:
+            track = np.zeros((height, width, 4), dtype=np.uint8)
+            track[..., :3] = to_rgb(track_color)
+            track[..., 3] = int(round(255 * track_opacity))
+            self.track = Sprite(track)
+
+    def blit_into(self, frame, t):
+        ct = t - self.start
+        x, y = resolve_position(self.pos(ct), (frame.shape[1], frame.shape[0]), self.size, self.relative_pos)
+        if self.track is not None:
+            self.track.blit(frame, x, y)
+        progress = min(max(ct / self.duration, 0.0), 1.0) if self.duration else 1.0
+        return self.sprite.blit(frame, x, y, width=int(round(self.size[0] * progress)))
+
+
+def section_title_layers(layer, script):
+    """Expand a "section_titles" layer into a text layer at the start of each scripted section."""
+    layers = []
+    for section in (script or {}).get("sections", []):
+        segments = section.get("segments") or [{}]
+        start = segments[0].get("narration", {}).get("start")
+        if start is None or not section.get("title"):
+            continue
+        layers.append(dict(layer, type="text", text=section["title"], start=start))
+    return layers
+
+
+def build_layer_clips(layers, video, scale=1.0, script=None):
+    """One timed clip per enabled layer, in stacking order (later layers draw on top)."""
+    video_w, video_h = video.size
+    clips = []
+    for spec in layers:
+        if not spec.get("enabled", True):
+            continue
+        layer = dict(LAYER_DEFAULTS.get(spec["type"], {}), **spec)
+        if layer["type"] == "section_titles":
+            clips += build_layer_clips(section_title_layers(layer, script), video, scale)
+            continue
+        start, duration = layer_window(layer, video.duration)
+        if duration <= 0:
+            continue
+        position = scale_position(layer["position"], scale)
+
+        if layer["type"] == "text":
+            font_path, fontsize = resolve_asset(layer["font"]), scale_value(layer["fontsize"], scale)
+            text_width = video_w - scale_value(TEXT_MARGIN, scale)
+            padding = scale_value(layer["padding"], scale)
+            lines = layout_lines(layer["text"], font_path, fontsize, text_width)
+            rgba = render_text("\n".join(lines), font_path, fontsize,
+                               color=layer["color"],
+                               width=text_width,
+                               align='center',
+                               bg_color=tuple(layer["bg_color"]) if layer["bg_color"] is not None else None,
+                               bg_opacity=layer["bg_opacity"],
+                               padding=(padding, padding))
+            clip = text_clip(rgba, fade_in=layer["fade_in"], fade_out=layer["fade_out"])
+        elif layer["type"] == "image":
+            path = resolve_asset(layer["path"])
+            width = scale_value(layer["width"], scale) if layer["width"] else None
+            rgba = image_rgba(path, width, layer["opacity"], os.stat(path).st_mtime_ns)
+            clip = text_clip(rgba, fade_in=layer["fade_in"], fade_out=layer["fade_out"])
+        elif layer["type"] == "progress":
+            clip = ProgressBarClip(video_w, max(1, scale_value(layer["height"], scale)), layer["color"],
+                                   layer["opacity"], layer["track_color"], layer["track_opacity"])
+        else:
+            raise ValueError(f"Unknown overlay layer type '{layer['type']}'")
+        clips.append(clip.set_start(start).set_duration(duration).set_position(position))
+    return clips
+
+
+def add_overlay_layers(input_video_path, output_video_path, layers, profile="final", smart=True, script=None):
+    """
+    Composite a stack of overlay layers (see LAYER_DEFAULTS) onto a video in a
+    single pass. Static layers are rasterized once into cached sprites, the
+    progress bar is a per-frame slice fill, and with smart=True, when every
+    layer sits in the opening or closing seconds, only those GOPs are
+    re-encoded and the rest is stream-copied. script supplies the section
+    start times for "section_titles" layers.
+    """
+    render = get_profile(profile)
+
+    # Load the original video
+    try:
+        video = VideoFileClip(input_video_path)
+    except Exception as e:
+        print(f"Error loading video: {e}")
+        sys.exit(1)
+
+    try:
+        clips = build_layer_clips(layers, video, render['scale'], script)
+    except OSError as e:
+        print(f"Error rendering overlay layer: {e}")
+        sys.exit(1)
+
+    # Only the start and end windows change: re-encode those GOPs, copy the middle
+    windows = overlay_windows(clips, video.duration) if smart and clips else None
+    if windows:
+        try:
+            if smart_render(video, input_video_path, clips, output_video_path, *windows, preset=render['preset']):
+                return
+        except RuntimeError as e:
+            print(f"Smart render failed, re-encoding the whole video: {e}")
+
+    # Composite all layers over the original video in one pass
+    final = TimelineCompositor(clips, bg_clip=video)
+
+    # Write the result to a file
+    try:
+        write_clip(final, output_video_path, video.fps, preset=render['preset'],
+                   audio_path=input_video_path, audio_codec="copy")
+    except Exception as e:
+        print(f"Error writing video file: {e}")
+        sys.exit(1)
+
+
 def add_text_overlay(input_video_path, output_video_path,
                     start_text, end_text,
                     start_duration, end_duration,
@@ -19,7 +206,7 @@ def add_text_overlay(input_video_path, output_video_path,
                     start_fontsize, end_fontsize,
                     start_position, end_position,
                     text_color, bg_color, col_opacity, padding,
-                    fade_in=False, fade_out=False, fade_duration=1):
+                    fade_in=False, fade_out=False, fade_duration=1, profile="final", smart=True):
     """
     Adds start and end text overlays to a video.
 
@@ -43,83 +230,23 @@ def add_text_overlay(input_video_path, output_video_path,
     - fade_in: Boolean to enable fade-in effect.
     - fade_out: Boolean to enable fade-out effect.
     - fade_duration: Duration of fade effects in seconds.
+    - profile: Render profile name; "draft" scales sizes and positions to the
+      reduced preview resolution and encodes with the draft preset.
+    - smart: Re-encode only the keyframe intervals under the start and end
+      overlays and stream-copy the rest; falls back to a full re-encode when
+      the overlays cover (nearly) the whole video or the joined result does
+      not have the source's frame count.
     """
-    
-    # Load the original video
-    try:
-        video = VideoFileClip(input_video_path)
-    except Exception as e:
-        print(f"Error loading video: {e}")
-        sys.exit(1)
-        
-    video_width, video_height = video.size
-
-    # Define a function to create a text clip with background
-    def create_text_clip(text, duration, start_time, font_path, fontsize, position):
-        # Create the text clip
-        try:
-            txt_clip = TextClip(txt=text,
-                                fontsize=fontsize,
-                                font=font_path,  # Use font file path
-                                color=text_color,
-                                method='caption',
-                                size=(video_width - 40, None),
-                                align='center')
-        except Exception as e:
-            print(f"Error creating TextClip with font '{font_path}': {e}")
-            sys.exit(1)
-        
-        # Add background with specified opacity
-        txt_bg = txt_clip.on_color(size=(txt_clip.w + 2*padding, txt_clip.h + 2*padding),
-                                   color=bg_color,
-                                   pos=(0,0),
-                                   col_opacity=col_opacity)
-        
-        # Apply fade-in and fade-out if enabled
-        if fade_in or fade_out:
-            txt_bg = txt_bg.set_start(start_time).set_duration(duration)
-            if fade_in:
-                txt_bg = txt_bg.crossfadein(fade_duration)
-            if fade_out:
-                txt_bg = txt_bg.crossfadeout(fade_duration)
-        else:
-            txt_bg = txt_bg.set_start(start_time).set_duration(duration)
-        
-        # Position the text
-        txt_bg = txt_bg.set_position(position)
-        
-        return txt_bg
-
-    # Create start text clip
-    start_clip = create_text_clip(
-        text=start_text,
-        duration=start_duration,
-        start_time=0,
-        font_path=start_font_path,
-        fontsize=start_fontsize,
-        position=start_position
-    )
-
-    # Create end text clip
-    end_start_time = max(video.duration - end_duration, 0)
-    end_clip = create_text_clip(
-        text=end_text,
-        duration=end_duration,
-        start_time=end_start_time,
-        font_path=end_font_path,
-        fontsize=end_fontsize,
-        position=end_position
-    )
-
-    # Composite the text clips over the original video
-    final = CompositeVideoClip([video, start_clip, end_clip])
-
-    # Write the result to a file
-    try:
-        final.write_videofile(output_video_path, codec='libx264', audio_codec='aac', threads=4, preset='medium')
-    except Exception as e:
-        print(f"Error writing video file: {e}")
-        sys.exit(1)
+    layers = [
+        {"type": "text", "text": start_text, "start": 0, "duration": start_duration,
+         "font": start_font_path, "fontsize": start_fontsize, "position": start_position},
+        {"type": "text", "text": end_text, "start": -end_duration, "duration": end_duration,
+         "font": end_font_path, "fontsize": end_fontsize, "position": end_position},
+    ]
+    for layer in layers:
+        layer.update(color=text_color, bg_color=bg_color, bg_opacity=col_opacity, padding=padding,
+                     fade_in=fade_duration if fade_in else 0, fade_out=fade_duration if fade_out else 0)
+    add_overlay_layers(input_video_path, output_video_path, layers, profile=profile, smart=smart)
 
 if __name__ == "__main__":
     # ==================== CONFIGURATION OPTIONS ====================
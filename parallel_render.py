@@ -0,0 +1,189 @@
+import os
+import json
+import hashlib
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from moviepy.config import get_setting
+from config import VIDEO_SIZE, FPS, OUTPUT_DIR
+from kenburns import KenBurns
+
+# -------------------- Encoder Settings --------------------
+# Every segment must be encoded identically for the concat demuxer to join
+# them with -c copy; keyframes at each segment start come for free.
+DEFAULT_PRESET = "medium"
+PIXEL_FORMAT = "yuv420p"
+
+# -------------------- Segment Cache --------------------
+# Rendered segments are stored under a hash of everything that affects their
+# pixels, so re-renders only encode segments whose inputs changed.
+SEGMENT_CACHE_DIR = OUTPUT_DIR / "segment_cache"
+SEGMENT_CACHE_VERSION = 1  # Bump when the segment renderer's output changes
+HASH_CHUNK_SIZE = 1 << 20
+_file_digests = {}
+
+
+def encoder_args(fps=FPS, preset=DEFAULT_PRESET):
+    """x264 settings shared by every segment (and by the final stream copy)."""
+    return [
+        "-c:v", "libx264", "-preset", preset, "-pix_fmt", PIXEL_FORMAT,
+        "-r", str(fps), "-video_track_timescale", str(fps * 1000),
+    ]
+
+
+def segment_frame_counts(segments, fps=FPS):
+    """Frames per segment from the cumulative timeline, so rounding never drifts."""
+    return [
+        max(1, round((seg["start"] + seg["duration"]) * fps) - round(seg["start"] * fps))
+        for seg in segments
+    ]
+
+
+def fade_gain(t, duration, fade):
+    """Fade-in/fade-out-through-black gain at time t (matches MoviePy fadein/fadeout)."""
+    if fade <= 0:
+        return 1.0
+    return max(0.0, min(1.0, t / fade, (duration - t) / fade))
+
+
+def file_digest(path):
+    """SHA-256 of a file's bytes, memoized per (path, size, mtime)."""
+    if not path:
+        return None
+    stat = os.stat(path)
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def segment_hash(job):
+    """Content hash of a segment job: image and audio bytes plus every render parameter."""
+    key = {
+        "version": SEGMENT_CACHE_VERSION,
+        "image": file_digest(job.get("image")),
+        "audio": file_digest(job.get("audio")),
+        **{k: job[k] for k in ("frames", "size", "fps", "zoom", "zoom_mode", "pan", "easing", "fade", "preset")},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def render_segment(job):
+    """
+    Render one segment (Ken Burns + fades) to its own video-only file.
+    Runs in a worker process, so the job is a plain dict of picklable values.
+    Returns the output path.
+    """
+    w, h = job["size"]
+    fps = job["fps"]
+    frames = job["frames"]
+    duration = frames / fps
+    if job.get("image"):
+        engine = KenBurns(Image.open(job["image"]), (w, h), duration, zoom=job["zoom"],
+                          zoom_mode=job["zoom_mode"], pan=job["pan"], easing=job["easing"], fps=fps)
+        frame_at = engine.frame
+    else:
+        black = np.zeros((h, w, 3), dtype=np.uint8)
+        frame_at = lambda t: black
+
+    # Encode to a unique temporary name so an interrupted render never poisons
+    # the cache and concurrent renders of the same segment never share a file
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(job["output"]), suffix=".part.mp4")
+    os.close(fd)
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+        "-an", *encoder_args(fps, job["preset"]), partial,
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    for n in range(frames):
+        t = n / fps
+        frame = frame_at(t)
+        gain = fade_gain(t, duration, job["fade"])
+        if gain < 1.0:
+            frame = (frame * gain).astype(np.uint8)
+        proc.stdin.write(frame.tobytes())
+    proc.stdin.close()
+    if proc.wait() != 0:
+        os.remove(partial)
+        raise RuntimeError(f"Segment encode failed for {job['output']}: {proc.stderr.read().decode(errors='replace')}")
+    os.replace(partial, job["output"])
+    return job["output"]
+
+
+def render_segments_parallel(jobs, workers=None):
+    """
+    Render segment jobs in a process pool, skipping any whose cached output
+    already exists. Returns output paths in timeline order.
+    """
+    missing = [job for job in jobs if not Path(job["output"]).exists()]
+    # Identical jobs (same image, motion and length) share one cache entry; render it once
+    pending = list({job["output"]: job for job in missing}.values())
+    workers = min(workers or os.cpu_count() or 1, max(1, len(pending)))
+    print(f"[VERBOSE] Reusing {len(jobs) - len(missing)} cached segment(s); "
+          f"rendering {len(pending)} unique of {len(missing)} on {workers} worker(s)")
+    if workers == 1:
+        for job in pending:
+            render_segment(job)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_segment, pending))
+    return [job["output"] for job in jobs]
+
+
+def concat_segments(segment_paths, output_path, audio_path=None, total_duration=None):
+    """
+    Join encoded segments with the concat demuxer (no video re-encode) and mux
+    in the separately mixed audio track.
+    """
+    output_path = Path(output_path)
+    list_path = output_path.with_suffix(".concat.txt")
+    list_path.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in segment_paths), encoding="utf-8")
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", str(list_path)]
+    if audio_path:
+        cmd += ["-i", str(audio_path), "-map", "0:v", "-map", "1:a", "-c:a", "aac"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart"]
+    if total_duration:
+        cmd += ["-t", f"{total_duration:.3f}"]
+    cmd.append(str(output_path))
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    list_path.unlink(missing_ok=True)
+    if result.returncode != 0:
+        print(f"[ERROR] Concat failed: {result.stderr.decode(errors='replace')}")
+        return None
+    return str(output_path)
+
+
+def segment_jobs(segments, cache_dir=SEGMENT_CACHE_DIR, size=VIDEO_SIZE, fps=FPS, zoom=0.1, zoom_mode="in_out",
+                 zoom_easing="ease_in_out", fade=0.15, preset=DEFAULT_PRESET):
+    """
+    Build one picklable render job per timeline segment. Each job's output
+    lives in cache_dir under its content hash.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for seg, frames in zip(segments, segment_frame_counts(segments, fps)):
+        job = {
+            "image": seg.get("image"),
+            "audio": seg.get("audio"),
+            "frames": frames,
+            "size": tuple(size),
+            "fps": fps,
+            "zoom": zoom,
+            "zoom_mode": zoom_mode,
+            "pan": seg.get("pan", "none"),
+            "easing": zoom_easing,
+            "fade": fade,
+            "preset": preset,
+        }
+        job["output"] = str(cache_dir / f"{segment_hash(job)}.mp4")
+        jobs.append(job)
+    return jobs
@@ -0,0 +1,28 @@
+from config import VIDEO_SIZE, RENDER_PROFILES
+
+
+def get_profile(name=None):
+    """Return the named render profile (defaults to "final")."""
+    name = name or "final"
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile '{name}'. Choose from: {', '.join(RENDER_PROFILES)}")
+    return RENDER_PROFILES[name]
+
+
+def scale_value(value, scale):
+    """Scale a pixel measurement, leaving non-numeric values (e.g. 'center') alone."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(round(value * scale))
+    return value
+
+
+def scale_position(position, scale):
+    """Scale an (x, y) position or a single MoviePy position keyword."""
+    if isinstance(position, (tuple, list)):
+        return tuple(scale_value(v, scale) for v in position)
+    return scale_value(position, scale)
+
+
+def profile_size(profile, size=VIDEO_SIZE):
+    """Output size for a profile, rounded to even dimensions for yuv420p."""
+    return tuple(max(2, int(round(v * profile["scale"] / 2)) * 2) for v in size)
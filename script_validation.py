@@ -0,0 +1,175 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Script Schema --------------------
+# Nested dicts describe required keys; a type (or tuple of types) is a leaf.
+# A one-element list means "a list whose items match this schema".
+SEGMENT_SCHEMA = {
+    "segment_number": int,
+    "narration": {"text": str},
+    "visual": {"prompt": str},
+}
+
+SECTION_SCHEMA = {
+    "section_number": int,
+    "title": str,
+    "segments": [SEGMENT_SCHEMA],
+}
+
+def schema_errors(value, schema, path="script"):
+    """
+    Return a list of human-readable problems where value does not match schema.
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path}: expected object"]
+        errors = []
+        for key, sub_schema in schema.items():
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+            else:
+                errors.extend(schema_errors(value[key], sub_schema, f"{path}.{key}"))
+        return errors
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            return [f"{path}: expected list"]
+        errors = []
+        for idx, item in enumerate(value):
+            errors.extend(schema_errors(item, schema[0], f"{path}[{idx}]"))
+        return errors
+    if schema is int and isinstance(value, bool):
+        return [f"{path}: expected int"]
+    if not isinstance(value, schema):
+        return [f"{path}: expected {getattr(schema, '__name__', schema)}"]
+    if isinstance(value, str) and not value.strip():
+        return [f"{path}: empty"]
+    return []
+
+
+def expected_section_shape(num_sections, num_segments):
+    """
+    Map section_number -> expected segment count: a one-segment HOOK, the main
+    sections, then a one-segment OUTRO.
+    """
+    shape = {1: 1}
+    for i in range(num_sections):
+        shape[i + 2] = num_segments
+    shape[num_sections + 2] = 1
+    return shape
+
+
+def incomplete_sections(script_data, num_sections, num_segments):
+    """
+    Return the sorted section numbers that are missing, malformed or short of segments.
+    """
+    shape = expected_section_shape(num_sections, num_segments)
+    complete = set()
+    for section in script_data.get("sections", []):
+        if not isinstance(section, dict):
+            continue
+        number = section.get("section_number")
+        errors = schema_errors(section, SECTION_SCHEMA, f"section {number}")
+        if errors:
+            logger.debug(f"Section {number} failed validation: {errors}")
+            continue
+        if len(section["segments"]) < shape.get(number, 1):
+            logger.debug(f"Section {number} has {len(section['segments'])} of {shape.get(number)} segments")
+            continue
+        complete.add(number)
+    return sorted(number for number in shape if number not in complete)
+
+
+# -------------------- Tolerant Parsing --------------------
+CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def strip_code_fences(text):
+    """
+    Return the body of a Markdown code block if the text contains one.
+    """
+    match = CODE_FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def repair_json(text):
+    """
+    Recover a JSON object from a GPT response.
+
+    Leading/trailing prose and code fences are dropped. If the object is
+    truncated (e.g. by max_tokens), it is cut back to the last complete value
+    and the open arrays and objects are closed.
+    Returns the repaired JSON text, or None if no object was found.
+    """
+    text = strip_code_fences(text)
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    closers = []
+    in_string = escaped = False
+    last_safe = None  # (cut index, closers open at that point)
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if closers:
+                closers.pop()
+            if not closers:
+                return text[start:i + 1]
+            last_safe = (i + 1, list(closers))
+        elif ch == ",":
+            last_safe = (i, list(closers))
+
+    if last_safe is None:
+        return None
+    cut, open_closers = last_safe
+    return text[start:cut] + "".join(reversed(open_closers))
+
+
+def parse_script_json(text):
+    """
+    Parse GPT output as JSON, repairing fences, surrounding prose and truncation.
+    Returns the parsed object, or None if it cannot be recovered.
+    """
+    try:
+        return json.loads(text.strip())
+    except json.JSONDecodeError as e:
+        logger.warning(f"Script output is not valid JSON ({e}); attempting repair.")
+
+    repaired = repair_json(text)
+    if repaired is None:
+        return None
+    for candidate in (repaired, TRAILING_COMMA_RE.sub(r"\1", repaired)):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    logger.error("Could not repair script JSON.")
+    return None
+
+
+def merge_sections(script_data, new_sections):
+    """
+    Replace or add sections by section_number and keep them in order.
+    """
+    by_number = {s.get("section_number"): s for s in script_data.get("sections", [])}
+    for section in new_sections:
+        by_number[section.get("section_number")] = section
+    ordered = sorted(by_number, key=lambda n: n if isinstance(n, int) else 0)
+    script_data["sections"] = [by_number[n] for n in ordered]
+    return script_data
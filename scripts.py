@@ -6,8 +6,18 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from openai.error import OpenAIError
+from script_validation import parse_script_json, incomplete_sections, expected_section_shape, merge_sections
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a character-based estimate
+    tiktoken = None
 import random
 import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
@@ -19,7 +29,12 @@ logger = logging.getLogger(__name__)
 # Constants
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 VIDEO_SCRIPTS_DIR = "./output/video_scripts/"
-MAX_SCRIPT_TOKENS = 3500  # Initial value; will be adjusted based on video length
+SCRIPT_MODEL = "gpt-4"
+MODEL_CONTEXT_TOKENS = 8192  # Prompt + completion must fit in the model's context window
+MUSIC_TYPES = ["cinematic", "ambient", "suspense", "upbeat", "melodic", "neutral", "inspiring", "dramatic"]
+TRANSITION_EFFECTS = ["swoosh", "fade-in", "whoosh", "glimmer"]
+LONG_FORM_THRESHOLD = 120  # Videos longer than this (seconds) are written outline-first, section by section
+MAX_SECTION_WORKERS = 8  # Concurrent per-section completions
 
 # Set OpenAI API Key
 if not OPENAI_API_KEY:
@@ -163,51 +178,292 @@ MODELS = {
     },
 }
 
+# -------------------- Local Voice & Style Selection --------------------
+# A small BM25 index over the structured VOICES/MODELS metadata lets us pick a
+# voice and style without a GPT round trip; GPT is only asked when the local
+# ranking is ambiguous.
+BM25_K1 = 1.5
+BM25_B = 0.75
+SELECTION_MIN_SCORE = 1.0  # Best candidate must score at least this much
+SELECTION_MIN_MARGIN = 0.2  # ...and beat the runner-up by this fraction
+KEYWORD_WEIGHT = 3  # Keywords and attributes count more than free-text descriptions
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "great", "has", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "this", "to", "voice", "well", "with", "works",
+}
+
+
+def tokenize(text):
+    """
+    Lowercase and split text into word tokens, dropping stopwords.
+    """
+    return [token for token in re.findall(r"[a-z]+", text.lower()) if token not in STOPWORDS]
+
+
+def build_bm25_index(documents):
+    """
+    Build a BM25 index from a mapping of name -> token list.
+    Returns a dict holding per-document term counts, lengths and IDF weights.
+    """
+    term_counts = {name: Counter(tokens) for name, tokens in documents.items()}
+    doc_lengths = {name: len(tokens) for name, tokens in documents.items()}
+    avg_length = sum(doc_lengths.values()) / max(1, len(doc_lengths))
+    doc_freq = Counter(term for counts in term_counts.values() for term in counts)
+    num_docs = len(documents)
+    idf = {
+        term: math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        for term, df in doc_freq.items()
+    }
+    return {
+        "term_counts": term_counts,
+        "doc_lengths": doc_lengths,
+        "avg_length": avg_length,
+        "idf": idf,
+    }
+
+
+def bm25_scores(index, query_text):
+    """
+    Score every indexed document against the query text.
+    Query term frequency is folded in so that repeated themes weigh more.
+    """
+    query_counts = Counter(tokenize(query_text))
+    scores = {}
+    for name, counts in index["term_counts"].items():
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * index["doc_lengths"][name] / index["avg_length"])
+        score = 0.0
+        for term, qtf in query_counts.items():
+            tf = counts.get(term)
+            if not tf:
+                continue
+            score += qtf * index["idf"][term] * tf * (BM25_K1 + 1) / (tf + norm)
+        scores[name] = score
+    return scores
+
+
+def select_locally(index, script_text):
+    """
+    Pick the best-scoring document for the script text.
+
+    Returns:
+        tuple: (name, confident) where name is None if nothing matched and
+        confident is True when the winner clears the score and margin thresholds.
+    """
+    scores = bm25_scores(index, script_text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] <= 0:
+        return None, False
+    best_name, best_score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    margin = (best_score - runner_up) / best_score
+    confident = best_score >= SELECTION_MIN_SCORE and margin >= SELECTION_MIN_MARGIN
+    logger.debug(f"Local selection: {best_name} (score={best_score:.2f}, margin={margin:.2f})")
+    return best_name, confident
+
+
+def voice_document(voice_info):
+    """
+    Tokens describing a voice: its description plus weighted attribute values.
+    """
+    tokens = tokenize(voice_info["description"])
+    for value in voice_info.get("attributes", {}).values():
+        tokens.extend(tokenize(value) * KEYWORD_WEIGHT)
+    return tokens
+
+
+def style_document(model_info):
+    """
+    Tokens describing an image style: its description plus weighted keywords.
+    """
+    tokens = tokenize(model_info["description"])
+    for keyword in model_info.get("keywords", []):
+        tokens.extend(tokenize(keyword) * KEYWORD_WEIGHT)
+    return tokens
+
+
+# Built once at import; selection is then a handful of dictionary lookups.
+VOICE_INDEX = build_bm25_index({name: voice_document(info) for name, info in VOICES.items()})
+STYLE_INDEX = build_bm25_index({name: style_document(info) for name, info in MODELS.items()})
+
 def generate_background_music(length):
     """
     Select background music types based on video length.
     Returns a comma-separated string of one or two music types.
     """
-    music_types = ["cinematic", "ambient", "suspense", "upbeat", "melodic", "neutral", "inspiring", "dramatic"]
-    selected = random.sample(music_types, 2) if length > 120 else random.sample(music_types, 1)
+    selected = random.sample(MUSIC_TYPES, 2) if length > 120 else random.sample(MUSIC_TYPES, 1)
     logger.debug(f"Selected background music: {selected}")
     return ", ".join(selected)
 
+def match_option(value, options):
+    """
+    Return the option name matching value (case-insensitive), or None.
+    """
+    if not isinstance(value, str):
+        return None
+    wanted = value.strip().lower()
+    for option in options:
+        if option.lower() == wanted:
+            return option
+    return None
+
+def validate_background_music(value, length):
+    """
+    Normalize a comma-separated background music choice against MUSIC_TYPES.
+    Returns the cleaned string, or None if no valid type was given.
+    """
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    if not isinstance(value, str):
+        return None
+    selected = []
+    for item in value.split(","):
+        music = match_option(item, MUSIC_TYPES)
+        if music and music not in selected:
+            selected.append(music)
+    return ", ".join(selected[:2 if length > 120 else 1]) or None
+
 def generate_transition_effect():
     """
     Select a transition effect type.
     """
-    transition_effects = ["swoosh", "fade-in", "whoosh", "glimmer"]
-    effect = random.choice(transition_effects)
+    effect = random.choice(TRANSITION_EFFECTS)
     logger.debug(f"Selected transition effect: {effect}")
     return effect
 
-def call_openai_api(messages, max_tokens, temperature):
+# -------------------- Token Accounting --------------------
+CHARS_PER_TOKEN = 4  # Rough average for English when tiktoken is unavailable
+TOKENS_PER_MESSAGE = 4  # Chat format overhead per message
+WORDS_PER_SECOND = 2.5  # Typical narration pace
+TOKENS_PER_WORD = 1.35
+VISUAL_PROMPT_TOKENS = 70  # A detailed image prompt
+SEGMENT_JSON_TOKENS = 90  # Keys, timings and punctuation around one segment
+SECTION_JSON_TOKENS = 30
+SCRIPT_JSON_TOKENS = 110  # Settings, tone/style/music choices and closing braces
+SOCIAL_MEDIA_TOKENS = 120
+OUTPUT_TOKEN_HEADROOM = 1.2
+MIN_COMPLETION_TOKENS = 256
+EXAMPLE_PROMPT_BUDGET = 250  # Style example tokens sent with each visual prompt request
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=SCRIPT_MODEL):
+    """
+    Return the tiktoken encoding for the model, or None if tiktoken is unavailable.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=SCRIPT_MODEL):
+    """
+    Count tokens in text locally, before anything is sent.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model=SCRIPT_MODEL):
+    """
+    Count prompt tokens for a list of chat messages, including per-message overhead.
+    """
+    return sum(count_tokens(m["content"], model) + TOKENS_PER_MESSAGE for m in messages) + 2
+
+
+def estimate_script_tokens(length, num_sections, num_segments):
+    """
+    Estimate the completion size of a full script from its shape: narration
+    words for the video length plus per-segment visual prompts and JSON overhead.
+    """
+    total_segments = num_sections * num_segments + 2  # HOOK and OUTRO
+    narration_tokens = length * WORDS_PER_SECOND * TOKENS_PER_WORD
+    structure_tokens = (
+        total_segments * (VISUAL_PROMPT_TOKENS + SEGMENT_JSON_TOKENS)
+        + (num_sections + 2) * SECTION_JSON_TOKENS
+        + SCRIPT_JSON_TOKENS
+    )
+    if length > 120:
+        structure_tokens += SOCIAL_MEDIA_TOKENS
+    return int((narration_tokens + structure_tokens) * OUTPUT_TOKEN_HEADROOM)
+
+
+def fit_max_tokens(prompt_tokens, expected_tokens, model_context=MODEL_CONTEXT_TOKENS):
+    """
+    Fit the requested max_tokens to the expected output, bounded by what is left
+    of the context window after the prompt.
+    """
+    available = model_context - prompt_tokens
+    return max(MIN_COMPLETION_TOKENS, min(expected_tokens, available))
+
+
+def calculate_max_tokens(length, num_sections=1, num_segments=1):
+    """
+    Calculate max tokens for a script of the given length and shape.
+    """
+    return min(MODEL_CONTEXT_TOKENS, estimate_script_tokens(length, num_sections, num_segments))
+
+
+def record_usage(usage_log, label, response, prompt_tokens, max_tokens, latency):
+    """
+    Append prompt/completion token counts and latency for one call to usage_log.
+    Falls back to the local prompt estimate when the response carries no usage.
+    """
+    if usage_log is None:
+        return
+    usage = response.get("usage", {}) if response is not None else {}
+    usage_log.append({
+        "label": label,
+        "model": SCRIPT_MODEL,
+        "prompt_tokens": usage.get("prompt_tokens", prompt_tokens),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "estimated_prompt_tokens": prompt_tokens,
+        "max_tokens": max_tokens,
+        "latency_seconds": round(latency, 3),
+        "success": response is not None,
+    })
+
+
+def summarize_usage(usage_log):
+    """
+    Total the prompt/completion tokens and latency across recorded calls.
+    """
+    return {
+        "calls": len(usage_log),
+        "prompt_tokens": sum(entry["prompt_tokens"] for entry in usage_log),
+        "completion_tokens": sum(entry["completion_tokens"] for entry in usage_log),
+        "latency_seconds": round(sum(entry["latency_seconds"] for entry in usage_log), 3),
+    }
+
+
+def call_openai_api(messages, max_tokens, temperature, usage_log=None, label="chat"):
     """
     Calls the OpenAI API with the given messages, max tokens, and temperature.
+    Prompt tokens are counted locally first; usage and latency go to usage_log.
     """
+    prompt_tokens = count_message_tokens(messages)
+    logger.debug(f"[{label}] Sending {prompt_tokens} prompt tokens, max_tokens={max_tokens}")
+    started = time.perf_counter()
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4",
+            model=SCRIPT_MODEL,
             messages=messages,
             max_tokens=max_tokens,
             temperature=temperature
         )
         logger.debug("OpenAI API call successful.")
-        return response
     except OpenAIError as e:
         logger.error(f"OpenAI API error: {e}")
-        return None
+        response = None
+    record_usage(usage_log, label, response, prompt_tokens, max_tokens, time.perf_counter() - started)
+    return response
 
-def calculate_max_tokens(length):
-    """
-    Calculate max tokens based on video length.
-    Adjust this function as needed to correlate video length with token count.
-    """
-    # Example: Assume 70 tokens per second, adjust as needed
-    return min(4000, length * 70)  # Cap at 4000 tokens
-
-def select_background_music_via_gpt(topic, music_options):
+def select_background_music_via_gpt(topic, music_options, usage_log=None):
     """
     Uses GPT to select the most appropriate background music from the provided options based on the video topic.
 
@@ -232,15 +488,18 @@ You are an assistant that selects the most appropriate background music for a vi
     """
 
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = call_openai_api(
             messages=[
                 {"role": "system", "content": "You are ChatGPT, a large language model trained by OpenAI."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=10,  # Enough to capture a single word or short phrase
-            temperature=0.0  # Low temperature for deterministic output
+            temperature=0.0,  # Low temperature for deterministic output
+            usage_log=usage_log,
+            label="background_music"
         )
+        if not response:
+            return "neutral"
 
         selected_music = response.choices[0].message['content'].strip().lower()
         # Normalize the response to match the predefined options
@@ -259,27 +518,265 @@ You are an assistant that selects the most appropriate background music for a vi
         logger.error(f"An unexpected error occurred during background music selection: {e}")
         return "neutral"
 
-def call_openai_api_generate_script(prompt, max_tokens, temperature):
+def script_messages(prompt):
+    """
+    Wrap a script-generation prompt in the chat message list sent to GPT.
+    """
+    return [
+        {"role": "system", "content": "You are ChatGPT, a large language model trained by OpenAI."},
+        {"role": "user", "content": prompt}
+    ]
+
+def call_openai_api_generate_script(prompt, max_tokens, temperature, usage_log=None):
     """
     Calls OpenAI API to generate the video script based on the provided prompt.
     """
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are ChatGPT, a large language model trained by OpenAI."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+    response = call_openai_api(
+        messages=script_messages(prompt),
+        max_tokens=max_tokens,
+        temperature=temperature,
+        usage_log=usage_log,
+        label="script"
+    )
+    if response:
         logger.debug("OpenAI API call for script generation successful.")
-        return response
-    except OpenAIError as e:
-        logger.error(f"OpenAI API error during script generation: {e}")
+    return response
+
+def section_skeleton(section_number, title, duration_per_segment):
+    """
+    A single-segment section used as the output format example in prompts.
+    """
+    return {
+        "section_number": section_number,
+        "title": title,
+        "section_duration": duration_per_segment,
+        "segments": [{
+            "segment_number": 1,
+            "narration": {"text": "...", "start_time": 0, "duration": duration_per_segment},
+            "visual": {
+                "type": "image",
+                "prompt": "...",
+                "start_time": 0,
+                "duration": duration_per_segment,
+                "apply_motion": False
+            },
+            "sound": {"transition_effect": TRANSITION_EFFECTS[0]}
+        }]
+    }
+
+def production_choice_instructions(long_form):
+    """
+    Instruction lines asking for tone, image_style and background_music from the enumerated options.
+    """
+    voice_options = "; ".join(
+        f"{name} ({', '.join(info['attributes'].values())})" for name, info in VOICES.items()
+    )
+    style_options = "; ".join(
+        f"{name} ({', '.join(info['keywords'])})" for name, info in MODELS.items()
+    )
+    return f"""Production choices for the whole video, using the exact names listed:
+   - tone (narration voice), one of: {voice_options}
+   - image_style, one of: {style_options}
+   - background_music, {'one or two comma-separated' if long_form else 'one'} of: {", ".join(MUSIC_TYPES)}"""
+
+def build_script_prompt(topic, length, size, num_sections, num_segments, duration_per_segment):
+    """
+    Build the script-generation prompt. Each instruction is stated once and the
+    output format is a compact single-segment JSON skeleton.
+    """
+    long_form = length > LONG_FORM_THRESHOLD
+    skeleton = {
+        "settings": {"use_background_music": True, "use_transitions": True, "video_size": size},
+        "tone": "...",
+        "image_style": "...",
+        "background_music": "...",
+        "sections": [section_skeleton(1, "Hook: Attention-Grabbing Opener", duration_per_segment)]
+    }
+    social_media_instructions = ""
+    if long_form:
+        skeleton["social_media"] = {"title": "...", "description": "...", "tags": ["..."]}
+        social_media_instructions = "\n6. Social media: a compelling title, a short description and 5 relevant tags."
+
+    return f"""You are an experienced scriptwriter. Write a {length}-second {'comprehensive' if long_form else 'engaging'} video script on the topic "{topic}" for a {size} video.
+
+1. Sections: exactly {num_sections + 2} sections. Section 1 is the HOOK, a single high-impact segment introducing the topic. The last section is the OUTRO, a single segment that summarizes or inspires. Between them, {num_sections} main sections of {num_segments} segments each, each with a specific title and flowing logically into the next.
+2. Narration: about {duration_per_segment} seconds per segment; clear, concise and in a consistent, engaging tone.
+3. Visuals: a detailed image prompt per segment that complements the narration; set apply_motion to true for about 30% of segments.
+4. Sound: a transition_effect per segment, one of: {", ".join(TRANSITION_EFFECTS)}.
+5. {production_choice_instructions(long_form)}{social_media_instructions}
+
+Respond with plain JSON only (no Markdown, code fences or extra text), following this skeleton and repeating sections and segments as needed:
+{json.dumps(skeleton, separators=(",", ":"))}"""
+
+def request_missing_sections(script_data, missing, topic, num_sections, num_segments, duration_per_segment, usage_log=None):
+    """
+    Ask GPT for only the missing or incomplete sections and merge them into the script.
+    Existing section titles are sent as context so the new sections fit the arc.
+    """
+    shape = expected_section_shape(num_sections, num_segments)
+    present = [
+        f"{s.get('section_number')}. {s.get('title', '')}"
+        for s in script_data.get("sections", [])
+        if s.get("section_number") not in missing
+    ]
+    wanted = "\n".join(
+        f"- Section {number}: {shape[number]} segment(s)"
+        + (" (HOOK)" if number == 1 else " (OUTRO)" if number == num_sections + 2 else "")
+        for number in missing
+    )
+    prompt = f"""You are completing a partially generated video script on the topic "{topic}".
+
+Sections already written:
+{chr(10).join(present) or "(none)"}
+
+Write only these sections, about {duration_per_segment} seconds of narration per segment:
+{wanted}
+
+Respond with plain JSON only, in the form {{"sections":[...]}}, using the same section and segment structure as the rest of the script (section_number, title, section_duration, segments with segment_number, narration, visual and sound)."""
+
+    segments_needed = sum(shape[number] for number in missing)
+    expected = int(segments_needed * (
+        duration_per_segment * WORDS_PER_SECOND * TOKENS_PER_WORD + VISUAL_PROMPT_TOKENS + SEGMENT_JSON_TOKENS
+    ) * OUTPUT_TOKEN_HEADROOM) + len(missing) * SECTION_JSON_TOKENS
+    messages = script_messages(prompt)
+    max_tokens = fit_max_tokens(count_message_tokens(messages), expected)
+    logger.info(f"Requesting {len(missing)} missing section(s): {missing}")
+
+    response = call_openai_api(messages, max_tokens, 0.7, usage_log=usage_log, label="script_continuation")
+    if not response:
+        logger.error("Continuation request failed; keeping the sections that were generated.")
+        return script_data
+
+    continuation = parse_script_json(response.choices[0].message['content'])
+    if isinstance(continuation, dict):
+        new_sections = continuation.get("sections", [])
+    elif isinstance(continuation, list):
+        new_sections = continuation
+    else:
+        logger.error("Could not parse continuation output; keeping the sections that were generated.")
+        return script_data
+    new_sections = [s for s in new_sections if isinstance(s, dict) and s.get("section_number") in missing]
+    return merge_sections(script_data, new_sections)
+
+def build_outline_prompt(topic, length, size, num_sections, num_segments):
+    """
+    Build the phase-one prompt: section titles, a one-line summary per section
+    and the whole-video production choices, without any narration.
+    """
+    skeleton = {
+        "settings": {"use_background_music": True, "use_transitions": True, "video_size": size},
+        "tone": "...",
+        "image_style": "...",
+        "background_music": "...",
+        "social_media": {"title": "...", "description": "...", "tags": ["..."]},
+        "sections": [{"section_number": 1, "title": "Hook: ...", "summary": "..."}]
+    }
+    return f"""You are an experienced scriptwriter. Outline a {length}-second comprehensive video on the topic "{topic}" for a {size} video.
+
+1. Sections: exactly {num_sections + 2} sections. Section 1 is the HOOK, introducing the topic with high impact. The last section is the OUTRO, which summarizes or inspires. Between them, {num_sections} main sections, each with a specific title, flowing logically into the next.
+2. For each section give only its title and a one-sentence summary of what it covers; the narration is written later.
+3. {production_choice_instructions(True)}
+4. Social media: a compelling title, a short description and 5 relevant tags.
+
+Respond with plain JSON only (no Markdown, code fences or extra text), following this skeleton:
+{json.dumps(skeleton, separators=(",", ":"))}"""
+
+def build_section_prompt(topic, length, outline, section_number, segment_count, duration_per_segment, last_section_number):
+    """
+    Build a phase-two prompt that expands one outlined section into segments.
+    The full outline is included so every section shares the same arc.
+    """
+    sections = outline.get("sections", [])
+    outline_lines = "\n".join(
+        f"{s.get('section_number')}. {s.get('title', '')}: {s.get('summary', '')}" for s in sections
+    )
+    current = next((s for s in sections if s.get("section_number") == section_number), {})
+    title = current.get("title", f"Section {section_number}")
+    if section_number == 1:
+        role = "This is the HOOK: open with a single high-impact segment that introduces the topic."
+    elif section_number == last_section_number:
+        role = "This is the OUTRO: close with a single segment that summarizes or inspires."
+    else:
+        role = "Pick up from the previous section and lead naturally into the next."
+    skeleton = section_skeleton(section_number, title, duration_per_segment)
+    return f"""You are an experienced scriptwriter writing one section of a {length}-second video on the topic "{topic}".
+
+Outline of the whole video:
+{outline_lines}
+
+Write section {section_number} ("{title}") with exactly {segment_count} segment(s) of about {duration_per_segment} seconds of narration each. {role}
+Give each segment a detailed image prompt that complements the narration, set apply_motion to true for about 30% of segments, and pick a transition_effect from: {", ".join(TRANSITION_EFFECTS)}.
+
+Respond with plain JSON only (no Markdown, code fences or extra text): a single section object following this skeleton:
+{json.dumps(skeleton, separators=(",", ":"))}"""
+
+def generate_section(topic, length, outline, section_number, segment_count, duration_per_segment,
+                     last_section_number, usage_log=None):
+    """
+    Expand one outlined section. Returns the section dict, or None on failure.
+    """
+    messages = script_messages(build_section_prompt(
+        topic, length, outline, section_number, segment_count, duration_per_segment, last_section_number
+    ))
+    expected = int(segment_count * (
+        duration_per_segment * WORDS_PER_SECOND * TOKENS_PER_WORD + VISUAL_PROMPT_TOKENS + SEGMENT_JSON_TOKENS
+    ) * OUTPUT_TOKEN_HEADROOM) + SECTION_JSON_TOKENS
+    max_tokens = fit_max_tokens(count_message_tokens(messages), expected)
+    response = call_openai_api(messages, max_tokens, 0.7, usage_log=usage_log, label=f"section_{section_number}")
+    if not response:
+        logger.error(f"Failed to generate section {section_number}.")
         return None
+    section = parse_script_json(response.choices[0].message['content'])
+    if not isinstance(section, dict):
+        logger.error(f"Could not parse section {section_number}.")
+        return None
+    if "sections" in section and isinstance(section["sections"], list) and section["sections"]:
+        section = section["sections"][0]  # Tolerate a wrapped response
+    section["section_number"] = section_number
+    return section
+
+def generate_script_in_sections(topic, length, size, num_sections, num_segments, duration_per_segment, usage_log=None):
+    """
+    Two-phase script generation for long-form videos: a short outline call fixes
+    titles, arc and production choices, then every section is expanded in
+    parallel with the outline as shared context and merged into one script.
+    Returns the script dict, or None if the outline could not be generated.
+    """
+    messages = script_messages(build_outline_prompt(topic, length, size, num_sections, num_segments))
+    expected = (num_sections + 2) * (SECTION_JSON_TOKENS + 40) + SCRIPT_JSON_TOKENS + SOCIAL_MEDIA_TOKENS
+    response = call_openai_api(
+        messages, fit_max_tokens(count_message_tokens(messages), expected), 0.7,
+        usage_log=usage_log, label="outline"
+    )
+    if not response:
+        logger.error("Failed to retrieve script outline.")
+        return None
+    outline = parse_script_json(response.choices[0].message['content'])
+    if not isinstance(outline, dict) or not outline.get("sections"):
+        logger.error("Failed to decode script outline.")
+        return None
+
+    shape = expected_section_shape(num_sections, num_segments)
+    outline["sections"] = [s for s in outline["sections"] if isinstance(s, dict)]
+    for idx, section in enumerate(outline["sections"], start=1):
+        section.setdefault("section_number", idx)
+    logger.info(f"Outline ready; expanding {len(shape)} sections in parallel.")
+
+    with ThreadPoolExecutor(max_workers=min(MAX_SECTION_WORKERS, len(shape))) as executor:
+        futures = [
+            executor.submit(
+                generate_section, topic, length, outline, number, count, duration_per_segment,
+                num_sections + 2, usage_log
+            )
+            for number, count in shape.items()
+        ]
+        sections = [future.result() for future in futures]
 
-def generate_video_script(topic, length, size, num_sections, num_segments):
+    script_data = {key: value for key, value in outline.items() if key != "sections"}
+    script_data["sections"] = [section for section in sections if section]
+    return script_data
+
+def generate_video_script(topic, length, size, num_sections, num_segments, two_phase=None):
     """
     Generates a comprehensive video script based on the provided parameters.
     Args:
@@ -288,264 +785,65 @@ def generate_video_script(topic, length, size, num_sections, num_segments):
         size (str): Size of the video (e.g., "1080x1920").
         num_sections (int): Number of sections in the video.
         num_segments (int): Number of segments per section.
+        two_phase (bool, optional): Outline first, then write sections in parallel.
+            Defaults to True for videos longer than LONG_FORM_THRESHOLD seconds.
     Returns:
         dict: The generated video script data.
     """
+    usage_log = []
+    if two_phase is None:
+        two_phase = length > LONG_FORM_THRESHOLD
     try:
-        # Calculate duration per segment
-        duration_per_segment = int(length / (num_sections * num_segments))
-
-        # Determine number of segments with motion
-        total_segments = num_sections * num_segments
-        num_motion_segments = max(1, int(total_segments * 0.3))
-        motion_indices = random.sample(range(total_segments), num_motion_segments)
-
-        
-        # Adjusted durations and section logic with HOOK + OUTRO
-        total_main_sections = num_sections
-        total_main_segments = num_sections * num_segments
-        total_segments = total_main_segments + 2  # one for hook, one for outro
+        # Durations with HOOK + OUTRO
+        total_segments = num_sections * num_segments + 2  # one for hook, one for outro
         duration_per_segment = max(6, math.ceil(length / total_segments * 1.15))
 
-        sections = []
-
-        # HOOK
-        sections.append({
-            "section_number": 1,
-            "title": "Hook: Attention-Grabbing Opener",
-            "section_duration": duration_per_segment,
-            "segments": [{
-                "segment_number": 1,
-                "narration": {
-                    "text": "Hook narration here.",
-                    "start_time": 0,
-                    "duration": duration_per_segment
-                },
-                "visual": {
-                    "type": "image",
-                    "prompt": f"High-impact visual for opening on topic: {topic}.",
-                    "start_time": 0,
-                    "duration": duration_per_segment,
-                    "apply_motion": False
-                },
-                "sound": {
-                    "transition_effect": generate_transition_effect()
-                }
-            }]
-        })
-
-        # Main sections
-        for i in range(num_sections):
-            section = {}
-            section_number = i + 2
-            section["section_number"] = section_number
-            section["title"] = f"Section {i + 1}: Title"
-            section["section_duration"] = num_segments * duration_per_segment
-            segments = []
-            for j in range(num_segments):
-                global_segment_index = 1 + i * num_segments + j  # shift start by 1 for HOOK
-                segment_number = j + 1
-                segment = {
-                    "segment_number": segment_number,
-                    "narration": {
-                        "text": "Narration text here.",
-                        "start_time": global_segment_index * duration_per_segment,
-                        "duration": duration_per_segment
-                    },
-                    "visual": {
-                        "type": "image",
-                        "prompt": f"Detailed visual prompt tailored to the {topic} topic.",
-                        "start_time": global_segment_index * duration_per_segment,
-                        "duration": duration_per_segment,
-                        "apply_motion": False
-                    },
-                    "sound": {
-                        "transition_effect": generate_transition_effect()
-                    }
-                }
-                segments.append(segment)
-            section["segments"] = segments
-            sections.append(section)
-
-        # OUTRO
-        outro_start = (total_segments - 1) * duration_per_segment
-        sections.append({
-            "section_number": num_sections + 2,
-            "title": "Outro: Wrap-up and CTA",
-            "section_duration": duration_per_segment,
-            "segments": [{
-                "segment_number": 1,
-                "narration": {
-                    "text": "Outro narration here.",
-                    "start_time": outro_start,
-                    "duration": duration_per_segment
-                },
-                "visual": {
-                    "type": "image",
-                    "prompt": f"Closing image to wrap up video on topic: {topic}.",
-                    "start_time": outro_start,
-                    "duration": duration_per_segment,
-                    "apply_motion": False
-                },
-                "sound": {
-                    "transition_effect": generate_transition_effect()
-                }
-            }]
-        })
-# Construct social media metadata if length > 120
-        social_media = {}
-        if length > 120:
-            social_media = {
-                "title": "Suggested title for social media platforms.",
-                "description": "Short and engaging description for social media platforms.",
-                "tags": ["tag1", "tag2", "tag3", "tag4", "tag5"]
-            }
-
-        # Construct the initial JSON structure without background_music
-        script_json = {
-            "settings": {
-                "use_background_music": True,
-                "use_transitions": True,
-                "video_size": size
-            },
-            "sections": sections
-        }
+        if two_phase:
+            script_data = generate_script_in_sections(
+                topic, length, size, num_sections, num_segments, duration_per_segment, usage_log
+            )
+            if not script_data:
+                return None
+        else:
+            prompt = build_script_prompt(topic, length, size, num_sections, num_segments, duration_per_segment)
+            prompt_tokens = count_message_tokens(script_messages(prompt))
+            max_tokens = fit_max_tokens(prompt_tokens, calculate_max_tokens(length, num_sections, num_segments))
+            logger.debug(f"Script prompt: {prompt_tokens} tokens, requesting up to {max_tokens} completion tokens")
+
+            # Call OpenAI API to generate the script
+            response = call_openai_api_generate_script(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                usage_log=usage_log
+            )
 
-        if length > 120:
-            script_json["social_media"] = social_media
+            if not response:
+                logger.error("Failed to retrieve video script.")
+                return None
 
-        # Serialize the JSON for reference (optional)
+            script_content = response.choices[0].message['content']
+            logger.debug(f"Raw response content:\n{script_content}")
 
+            # Parse JSON, repairing fences, stray text and truncation
+            script_data = parse_script_json(script_content)
+            if not isinstance(script_data, dict):
+                logger.error("Failed to decode GPT script output.")
+                return None
 
-        # Prepare dynamic sections to avoid backslash issues inside f-strings
-        social_media_instructions = ""
-        social_media_json_block = ""
-        if length > 120:
-            social_media_instructions = (
-                "5. **Social Media:**\n"
-                "   - Generate a compelling title and description for social media platforms.\n"
-                "   - Provide relevant tags to enhance discoverability."
+        # Ask only for sections that are missing or incomplete
+        missing = incomplete_sections(script_data, num_sections, num_segments)
+        if missing:
+            script_data = request_missing_sections(
+                script_data, missing, topic, num_sections, num_segments, duration_per_segment, usage_log
             )
-            social_media_json_block = f'"social_media": {json.dumps(social_media, indent=4)}'
-        prompt_json = json.dumps(script_json, indent=4)
-
-        # Construct the prompt for OpenAI to generate the actual script without background_music
-        prompt = f"""
-You are an experienced scriptwriter tasked with creating a {length}-second {'comprehensive' if length > 120 else 'engaging'} video script on the topic "{topic}".
-
-**Settings:**
-- Video Size: {size}
-- Number of Sections: {num_sections}
-- Number of Segments per Section: {num_segments}
-
-**Your Task:**
-
-1. **Sections:**
-   - This video must include a total of {num_sections + 2} sections.
-   - Section 1 is the **HOOK**: a single, high-impact attention-grabbing segment that introduces the topic.
-   - The last section is the **OUTRO**: a single, motivational or summarizing segment that wraps up the story or leaves viewers with a final thought.
-   - Between them, generate {num_sections} regular sections, each with {num_segments} segments.
-
-1. **Sections:**
-   - Section 1 should be the **HOOK**: a single, high-impact attention-grabbing segment introducing the topic.
-   - The final section should be the **OUTRO**: a single wrap-up or call-to-action segment that summarizes or inspires.
-   - Between them, include {num_sections} main sections, each with {num_segments} segments.
-
-1. **Structure:**
-   - Divide the video into {num_sections} sections.
-   - Each section contains {num_segments} narration segments.
-   - Ensure each section has a specific title and flows logically to the next.
-
-2. **Narration:**
-   - Each narration segment should last approximately {duration_per_segment} seconds.
-   - Begin with a compelling hook.
-   - Provide clear and concise information relevant to the topic.
-   - Maintain a consistent and engaging tone.
-
-3. **Visuals:**
-   - For each narration segment, provide a detailed visual prompt.
-   - Use diverse and engaging imagery that complements the narration.
-   - Include an `apply_motion` tag set to `true` for approximately 30% of the segments.
-
-4. **Sound:**
-   - Suggest transition effects for each section.
-   - **Note:** Background music will be assigned separately and should not be included here.
-
-{social_media_instructions}
-
-**Output Format:**
-
-Provide the output in JSON format with the following structure:
-
-{{
-    "settings": {{
-        "use_background_music": true,
-        "use_transitions": true,
-        "video_size": "{size}"
-    }},
-    "sections": [
-        {{
-            "section_number": {i + 1},
-            "title": "Section {i + 1}: Title",
-            "section_duration": {int(length / num_sections)},
-            "segments": [
-                {{
-                    "segment_number": 1,
-                    "narration": {{
-                        "text": "Narration text here.",
-                        "start_time": 0,
-                        "duration": {duration_per_segment}
-                    }},
-                    "visual": {{
-                        "type": "image",
-                        "prompt": "Detailed visual prompt tailored to the {topic} topic.",
-                        "start_time": 0,
-                        "duration": {duration_per_segment},
-                        "apply_motion": false
-                    }},
-                    "sound": {{
-                        "transition_effect": "{generate_transition_effect()}"
-                    }}
-                }}
-            ]
-        }}
-    ]{"," if length > 120 else ""}
-    {social_media_json_block}
-}}
-
-**Important Instructions:**
-
-- **Provide only the JSON output** in your response. Do not include any explanations, reasoning, or additional text outside the JSON.
-- **Do not use Markdown formatting** or include code blocks. The JSON should be plain text starting with `{{` and ending with `}}`.
-        """
-
-        # Call OpenAI API to generate the script
-        response = call_openai_api_generate_script(
-            prompt=prompt,
-            max_tokens=MAX_SCRIPT_TOKENS,
-            temperature=0.7
-        )
+        script_data.setdefault("settings", {"use_background_music": True, "use_transitions": True, "video_size": size})
 
-        if not response:
-            logger.error("Failed to retrieve video script.")
-            return None
-
-        script_content = response.choices[0].message['content']
-        logger.debug(f"Raw response content:\n{script_content}")
-
-        
-
-# Parse JSON
-        try:
-            script_data = json.loads(script_content.strip())
-            logger.debug(f"Generated script data: {json.dumps(script_data, indent=2)}")
-            early_path = os.path.join(VIDEO_SCRIPTS_DIR, f"{topic.lower().replace(' ', '_')}_raw.json")
-            with open(early_path, 'w', encoding='utf-8') as f:
-                json.dump(script_data, f, indent=4)
-            logger.info(f"Raw script saved early at: {early_path}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode GPT script output: {e}")
-            return None
+        logger.debug(f"Generated script data: {json.dumps(script_data, indent=2)}")
+        early_path = os.path.join(VIDEO_SCRIPTS_DIR, f"{topic.lower().replace(' ', '_')}_raw.json")
+        with open(early_path, 'w', encoding='utf-8') as f:
+            json.dump(script_data, f, indent=4)
+        logger.info(f"Raw script saved early at: {early_path}")
         # Inject missing transition effects
 
         for sec in script_data.get("sections", []):
@@ -583,16 +881,31 @@ Provide the output in JSON format with the following structure:
         combined_text = " ".join(narration_texts)
 
 
-        # Select voice and style, and set background music
+        # Validate the voice, style and music chosen in the same completion;
+        # only fall back to the selectors when GPT picked something unknown
 
-        script_data["tone"] = select_voice(combined_text)
+        tone = match_option(script_data.get("tone"), VOICES)
+        if not tone:
+            logger.warning(f"Script returned an unknown tone: {script_data.get('tone')!r}. Selecting separately.")
+            tone = select_voice(combined_text, usage_log)
+        script_data["tone"] = tone
 
-        selected_style, _ = select_style(combined_text)
+        image_style = match_option(script_data.get("image_style"), MODELS)
+        if not image_style:
+            logger.warning(f"Script returned an unknown image style: {script_data.get('image_style')!r}. Selecting separately.")
+            image_style, _ = select_style(combined_text, usage_log)
+        script_data["image_style"] = image_style
 
-        script_data["image_style"] = selected_style
-
-        script_data["background_music"] = generate_background_music(length)
+        background_music = validate_background_music(script_data.get("background_music"), length)
+        if not background_music:
+            logger.warning(f"Script returned unknown background music: {script_data.get('background_music')!r}. Picking at random.")
+            background_music = generate_background_music(length)
+        script_data["background_music"] = background_music
 
+        script_data.setdefault("metadata", {})["openai_usage"] = {
+            "calls": usage_log,
+            "totals": summarize_usage(usage_log),
+        }
 
         return script_data
 
@@ -600,9 +913,26 @@ Provide the output in JSON format with the following structure:
     except Exception as e:
         logger.error(f"Unhandled error: {e}")
         return None
-def select_voice(script_text):
+def select_voice(script_text, usage_log=None):
     """
     Selects the most appropriate voice from the VOICES dictionary based on the complete script.
+    Uses the local BM25 index and only falls back to GPT when the match is not confident.
+
+    Args:
+        script_text (str): The complete narration text of the script.
+
+    Returns:
+        str: The name of the selected voice.
+    """
+    selected_voice, confident = select_locally(VOICE_INDEX, script_text)
+    if confident:
+        logger.debug(f"Selected voice locally: {selected_voice}")
+        return selected_voice
+    return select_voice_via_gpt(script_text, usage_log)
+
+def select_voice_via_gpt(script_text, usage_log=None):
+    """
+    Asks GPT to select the most appropriate voice from the VOICES dictionary.
 
     Args:
         script_text (str): The complete narration text of the script.
@@ -635,15 +965,18 @@ Please analyze the script and select the most appropriate voice for the narratio
     """
 
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = call_openai_api(
             messages=[
                 {"role": "system", "content": "You are ChatGPT, an assistant that selects the most appropriate narration voice based on script content and provided voice options."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=10,
-            temperature=0.0  # Ensures consistent and deterministic output
+            temperature=0.0,  # Ensures consistent and deterministic output
+            usage_log=usage_log,
+            label="voice"
         )
+        if not response:
+            return "Frederick Surrey"
 
         selected_voice = response.choices[0].message['content'].strip()
         logger.debug(f"Selected voice by GPT: {selected_voice}")
@@ -664,7 +997,22 @@ Please analyze the script and select the most appropriate voice for the narratio
         # Default voice in case of error
         return "Frederick Surrey"
 
-def select_style(script_text):
+def select_style(script_text, usage_log=None):
+    """
+    Selects the most appropriate style using the local BM25 index over MODELS,
+    falling back to GPT when the match is not confident.
+    Args:
+        script_text (str): The entire script narration.
+    Returns:
+        tuple: Selected style name and its corresponding model info.
+    """
+    selected_style, confident = select_locally(STYLE_INDEX, script_text)
+    if confident:
+        logger.debug(f"Selected style locally: {selected_style}")
+        return selected_style, MODELS[selected_style]
+    return select_style_via_gpt(script_text, usage_log)
+
+def select_style_via_gpt(script_text, usage_log=None):
     """
     Selects the most appropriate style by sending the script back to GPT along with the style list.
     Args:
@@ -694,12 +1042,16 @@ Please analyze the script narration and select the most appropriate style from t
 
     # Call the OpenAI API
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        response = call_openai_api(
             messages=[{"role": "user", "content": prompt}],
             max_tokens=20,
-            temperature=0.3  # Lower temperature for consistency
+            temperature=0.3,  # Lower temperature for consistency
+            usage_log=usage_log,
+            label="style"
         )
+        if not response:
+            selected_style = random.choice(list(MODELS.keys()))
+            return selected_style, MODELS[selected_style]
 
         selected_style = response.choices[0].message['content'].strip()
         logger.debug(f"Selected style from GPT:\n{selected_style}")
@@ -727,98 +1079,72 @@ Please analyze the script narration and select the most appropriate style from t
         model_info = MODELS[selected_style]
         return selected_style, model_info
 
-def update_visual_prompts(script_data, style_info):
+def fit_example_prompts(example_prompts, budget=EXAMPLE_PROMPT_BUDGET):
+    """
+    Keep as many example prompts as fit in the token budget (always at least one).
+    """
+    selected, used = [], 0
+    for example in example_prompts:
+        tokens = count_tokens(example)
+        if selected and used + tokens > budget:
+            break
+        selected.append(example)
+        used += tokens
+    return selected
+
+def generate_visual_prompt(narration_text, style_context, usage_log=None):
+    """
+    Generate one visual prompt for a narration using the shared style context message.
+    Returns None if the request fails.
+    """
+    try:
+        response = call_openai_api(
+            messages=[
+                {"role": "system", "content": style_context},
+                {"role": "user", "content": f"Narration:\n\"\"\"\n{narration_text}\n\"\"\""}
+            ],
+            max_tokens=150,
+            temperature=0.7,
+            usage_log=usage_log,
+            label="visual_prompt"
+        )
+        if not response:
+            return None
+        visual_prompt = response.choices[0].message['content'].strip()
+        logger.debug(f"Generated visual prompt:\n{visual_prompt}")
+        return visual_prompt
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during visual prompt generation: {e}")
+        return None
+
+def update_visual_prompts(script_data, style_info, usage_log=None):
     """
     Updates the visual prompts in the script data based on the selected style.
+    The style description and a token-budgeted subset of its example prompts are
+    built once and shared by every request.
     Args:
         script_data (dict): The script data containing sections and segments.
         style_info (dict): The selected style information from MODELS.
+        usage_log (list, optional): Collects token usage and latency per call.
     """
-    style_description = style_info["description"]
-    example_prompts = "\n".join(style_info["example_prompts"])
+    example_prompts = "\n".join(fit_example_prompts(style_info["example_prompts"]))
+    style_context = (
+        "Generate a detailed visual prompt that complements the given narration and adheres to this style.\n\n"
+        f"Style: {style_info['description']}\n\n"
+        f"Example prompts:\n{example_prompts}\n\n"
+        "Provide only the visual prompt text without any additional explanations."
+    )
 
     for section in script_data.get("sections", []):
-        # For sections with segments
-        if "segments" in section:
-            for segment in section["segments"]:
-                narration_text = segment["narration"].get("text", "")
-                if not narration_text:
-                    continue
-                # Generate new visual prompt
-                prompt = f"""
-Given the following narration text:
-
-\"\"\"
-{narration_text}
-\"\"\"
-
-And the following style description:
-
-{style_description}
-
-With these example prompts:
-
-{example_prompts}
-
-Generate a detailed visual prompt that complements the narration and adheres to the style guidelines.
-
-Provide only the visual prompt text without any additional explanations.
-                """
-
-                try:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-4",
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=150,
-                        temperature=0.7
-                    )
-                    visual_prompt = response.choices[0].message['content'].strip()
-                    logger.debug(f"Generated visual prompt:\n{visual_prompt}")
-                    segment["visual"]["prompt"] = visual_prompt
-                except OpenAIError as e:
-                    logger.error(f"OpenAI API error during visual prompt generation: {e}")
-                except Exception as e:
-                    logger.error(f"An unexpected error occurred during visual prompt generation: {e}")
-        else:
-            # For sections without segments (short videos)
-            narration_text = section.get("narration", {}).get("text", "")
+        # Sections with segments, or sections without segments (short videos)
+        targets = section["segments"] if "segments" in section else [section]
+        for target in targets:
+            narration_text = target.get("narration", {}).get("text", "")
             if not narration_text:
                 continue
-            # Generate new visual prompt
-            prompt = f"""
-Given the following narration text:
-
-\"\"\"
-{narration_text}
-\"\"\"
-
-And the following style description:
-
-{style_description}
-
-With these example prompts:
-
-{example_prompts}
-
-Generate a detailed visual prompt that complements the narration and adheres to the style guidelines.
-
-Provide only the visual prompt text without any additional explanations.
-            """
-
-            try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=150,
-                    temperature=0.7
-                )
-                visual_prompt = response.choices[0].message['content'].strip()
-                logger.debug(f"Generated visual prompt:\n{visual_prompt}")
-                section["visual"]["prompt"] = visual_prompt
-            except OpenAIError as e:
-                logger.error(f"OpenAI API error during visual prompt generation: {e}")
-            except Exception as e:
-                logger.error(f"An unexpected error occurred during visual prompt generation: {e}")
+            visual_prompt = generate_visual_prompt(narration_text, style_context, usage_log)
+            if visual_prompt:
+                target["visual"]["prompt"] = visual_prompt
 
 def save_script(script_data, tone, style, topic, filename=None):
     """
@@ -856,7 +1182,7 @@ def save_script(script_data, tone, style, topic, filename=None):
         logger.error(f"An error occurred while saving the script: {e}")
         return None
 
-def select_voice_and_style(script_text):
+def select_voice_and_style(script_text, usage_log=None):
     """
     Selects the most appropriate voice and style based on the complete script.
 
@@ -866,8 +1192,8 @@ def select_voice_and_style(script_text):
     Returns:
         tuple: Selected voice name, selected style name, and style info.
     """
-    selected_voice = select_voice(script_text)
-    selected_style, style_info = select_style(script_text)
+    selected_voice = select_voice(script_text, usage_log)
+    selected_style, style_info = select_style(script_text, usage_log)
     return selected_voice, selected_style, style_info
 
 def main():
@@ -892,11 +1218,6 @@ def main():
             print("Invalid input. Please ensure that length, number of sections, and number of segments are numbers.")
             return
 
-        # Adjust MAX_SCRIPT_TOKENS based on video length
-        global MAX_SCRIPT_TOKENS
-        MAX_SCRIPT_TOKENS = calculate_max_tokens(length)
-        logger.debug(f"Adjusted MAX_SCRIPT_TOKENS based on video length: {MAX_SCRIPT_TOKENS}")
-
         # Generate the video script
         script_data = generate_video_script(topic, length, size, num_sections, num_segments)
 
@@ -904,29 +1225,20 @@ def main():
             print("Failed to generate the script. Please check the logs for more details.")
             return
 
-        # Combine all narration texts for voice and style selection
-        narration_texts = []
-        for section in script_data.get("sections", []):
-            if "segments" in section:
-                for segment in section["segments"]:
-                    narration_text = segment.get("narration", {}).get("text", "")
-                    if narration_text:
-                        narration_texts.append(narration_text)
-            else:
-                narration_text = section.get("narration", {}).get("text", "")
-                if narration_text:
-                    narration_texts.append(narration_text)
-
-        combined_narration = " ".join(narration_texts)
-        logger.debug(f"Combined narration text for voice and style selection:\n{combined_narration}")
+        # Token usage is accumulated into the job metadata started by generate_video_script
+        usage = script_data.setdefault("metadata", {}).setdefault("openai_usage", {"calls": []})
+        usage_log = usage["calls"]
 
-        # Select the appropriate voice and style based on the combined narration
-        selected_voice, selected_style, style_info = select_voice_and_style(combined_narration)
+        # Voice and style were chosen and validated with the script itself
+        selected_voice = script_data["tone"]
+        selected_style = script_data["image_style"]
+        style_info = MODELS[selected_style]
         logger.info(f"Selected voice: {selected_voice}")
         logger.info(f"Selected style: {selected_style}")
 
         # Update the visual prompts based on the selected style
-        update_visual_prompts(script_data, style_info)
+        update_visual_prompts(script_data, style_info, usage_log)
+        usage["totals"] = summarize_usage(usage_log)
 
         # Save the script with tone (voice) and style information
         saved_path = save_script(script_data, selected_voice, selected_style, topic)
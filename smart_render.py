@@ -0,0 +1,147 @@
+import os
+import re
+import subprocess
+import tempfile
+from moviepy.config import get_setting
+from compositor import TimelineCompositor
+from frame_writer import write_clip
+
+# -------------------- Keyframes --------------------
+SHOWINFO_TIME = re.compile(r"\bpts_time:\s*(-?[0-9.]+)")
+TIME_EPSILON = 1e-3
+
+
+def keyframe_times(video_path):
+    """Presentation times (seconds) of the first video stream's keyframes; only keyframes are decoded."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-hide_banner", "-nostats", "-skip_frame", "nokey",
+        "-i", str(video_path), "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not read keyframes of {video_path}: {result.stderr.decode(errors='replace')}")
+    return sorted(float(m) for m in SHOWINFO_TIME.findall(result.stderr.decode(errors="replace")))
+
+
+def frame_count(video_path):
+    """Number of frames in the first video stream: one framecrc line per packet, nothing is decoded."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-v", "error", "-i", str(video_path),
+        "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not count frames of {video_path}: {result.stderr.decode(errors='replace')}")
+    return sum(1 for line in result.stdout.splitlines() if line and not line.startswith(b"#"))
+
+
+def plan_cuts(keyframes, duration, head, tail):
+    """
+    Keyframe-aligned (head_end, tail_start) so [0, head_end) covers the first
+    `head` seconds and [tail_start, duration) the last `tail`; the middle can
+    then be stream-copied. None when the windows leave no middle to copy.
+    """
+    head_end = 0.0
+    if head > 0:
+        head_end = next((k for k in keyframes if k >= head - TIME_EPSILON), duration)
+    tail_start = duration
+    if tail > 0:
+        tail_start = max((k for k in keyframes if k <= duration - tail + TIME_EPSILON), default=0.0)
+    if tail_start - head_end < TIME_EPSILON:
+        return None
+    return head_end, tail_start
+
+
+def overlay_windows(clips, duration):
+    """
+    (head, tail) seconds such that every clip lies within the first `head` or
+    the last `tail` seconds, or None if some clip shows in between.
+    """
+    head = max((c.end for c in clips if c.start < TIME_EPSILON), default=0.0)
+    tail_start = min((c.start for c in clips if c.end > duration - TIME_EPSILON), default=duration)
+    for clip in clips:
+        if clip.end > head + TIME_EPSILON and clip.start < tail_start - TIME_EPSILON:
+            return None
+    return head, duration - tail_start
+
+
+def concat_file(path):
+    """A concat demuxer `file` line, quoting the path for its parser."""
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+# -------------------- Rendering --------------------
+def copy_middle(video_path, head_end, tail_start, tmp_dir):
+    """
+    Stream-copy the video between two keyframes with the segment muxer, which
+    splits on whole packets at the keyframes. (A concat inpoint/outpoint cuts
+    by DTS and lets reordered B-frames leak across the seam.)
+    """
+    pattern = os.path.join(tmp_dir, "part%d.mp4")
+    times = ",".join(f"{t:.6f}" for t in (head_end, tail_start) if t > 0)
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-i", str(video_path),
+        "-map", "0:v:0", "-c", "copy", "-f", "segment", "-segment_times", times,
+        "-reset_timestamps", "1", pattern,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed splitting {video_path}: {result.stderr.decode(errors='replace')}")
+    middle = pattern % (1 if head_end > 0 else 0)
+    if not os.path.exists(middle):
+        raise RuntimeError(f"ffmpeg did not split {video_path} at {times}")
+    return middle
+
+
+def render_window(video, clips, start, end, output_path, fps, preset):
+    """Re-encode video[start:end] with the clips that overlap it composited on top (no audio)."""
+    shifted = [c.set_start(c.start - start) for c in clips if c.start < end and (c.end is None or c.end > start)]
+    window = TimelineCompositor(shifted, bg_clip=video.subclip(start, end)) if shifted else video.subclip(start, end)
+    return write_clip(window, output_path, fps, preset=preset)
+
+
+def smart_render(video, video_path, clips, output_path, head, tail, preset="medium"):
+    """
+    Write video_path with overlay clips confined to its first `head` and last
+    `tail` seconds, re-encoding only the GOPs that overlap those windows. The
+    untouched middle is stream-copied between keyframes, the pieces are joined
+    with the concat demuxer and the source audio is copied as-is.
+    Returns output_path, or None if there is no middle worth copying (the
+    caller should render the whole video instead). Raises RuntimeError if
+    the joined video does not have the source's frame count.
+    """
+    cuts = plan_cuts(keyframe_times(video_path), video.duration, head, tail)
+    if cuts is None:
+        return None
+    head_end, tail_start = cuts
+    print(f"[VERBOSE] Smart render: re-encoding 0-{head_end:.2f}s and {tail_start:.2f}-{video.duration:.2f}s, "
+          f"copying the {tail_start - head_end:.2f}s between")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        entries = []
+        if head_end > 0:
+            head_path = os.path.join(tmp_dir, "head.mp4")
+            render_window(video, clips, 0, head_end, head_path, video.fps, preset)
+            entries.append(concat_file(head_path))
+        entries.append(concat_file(copy_middle(video_path, head_end, tail_start, tmp_dir)))
+        if tail_start < video.duration:
+            tail_path = os.path.join(tmp_dir, "tail.mp4")
+            render_window(video, clips, tail_start, video.duration, tail_path, video.fps, preset)
+            entries.append(concat_file(tail_path))
+
+        list_path = os.path.join(tmp_dir, "parts.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(entries) + "\n")
+        cmd = [
+            get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path, "-i", str(video_path),
+            "-map", "0:v:0", "-map", "1:a:0?", "-c", "copy", "-movflags", "+faststart", str(output_path),
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed joining {output_path}: {result.stderr.decode(errors='replace')}")
+
+    expected, joined = frame_count(video_path), frame_count(output_path)
+    if joined != expected:
+        raise RuntimeError(f"joined video has {joined} frames, source has {expected}")
+    return str(output_path)
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+import numpy as np
+from moviepy.config import get_setting
+
+# -------------------- Configuration --------------------
+SAMPLE_RATE = 44100  # Output sample rate used by the renders
+CHANNELS = 2
+NORMALIZE_PEAK = 0.89  # -1 dBFS
+SOUND_BANK_DIR = Path("./sounds/pcm")
+
+# Memory-mapped arrays already opened in this process, keyed by .npy path
+_loaded = {}
+
+
+def source_key(path, sample_rate=SAMPLE_RATE):
+    """Cache key for a source file: its path, size, mtime and the target rate."""
+    stat = Path(path).stat()
+    raw = f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{sample_rate}|{CHANNELS}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def decode_pcm(path, sample_rate=SAMPLE_RATE):
+    """Decode any audio file to (samples, CHANNELS) float32 at sample_rate via ffmpeg."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-v", "error", "-i", str(path),
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", str(CHANNELS), "-ar", str(sample_rate), "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, CHANNELS)
+
+
+def store(array, npy_path):
+    """
+    Write an array to the bank and return it memory-mapped. Each writer uses
+    its own temp file, so concurrent decodes of one sound cannot clobber
+    each other; the last atomic rename wins with identical contents.
+    """
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=npy_path.parent, suffix=".tmp.npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return open_mapped(npy_path)
+
+
+def open_mapped(npy_path):
+    """Open a banked array read-only and memory-mapped, once per process."""
+    key = str(npy_path)
+    if key not in _loaded:
+        _loaded[key] = np.load(npy_path, mmap_mode="r")
+    return _loaded[key]
+
+
+def load_sound(path, sample_rate=SAMPLE_RATE, normalize=True):
+    """
+    Return the sound as memory-mapped float32 PCM, decoding it only the first time.
+    Sounds are peak-normalized to NORMALIZE_PEAK so volume settings mean the same
+    thing for every Freesound file.
+    """
+    npy_path = SOUND_BANK_DIR / f"{source_key(path, sample_rate)}{'_n' if normalize else ''}.npy"
+    if npy_path.exists():
+        return open_mapped(npy_path)
+    print(f"[VERBOSE] Decoding into sound bank: {path}")
+    pcm = decode_pcm(path, sample_rate)
+    if normalize and pcm.size:
+        peak = float(np.abs(pcm).max())
+        if peak > 0:
+            pcm = pcm * (NORMALIZE_PEAK / peak)
+    return store(pcm, npy_path)
+
+
+def fit_length(pcm, num_samples):
+    """Trim or loop PCM to exactly num_samples frames."""
+    if len(pcm) == 0:
+        return np.zeros((num_samples, CHANNELS), dtype=np.float32)
+    if len(pcm) >= num_samples:
+        return pcm[:num_samples]
+    repeats = -(-num_samples // len(pcm))
+    return np.tile(pcm, (repeats, 1))[:num_samples]
+
+
+def transition_variant(path, duration, sample_rate=SAMPLE_RATE):
+    """
+    The transition SFX trimmed (or looped) to `duration` seconds with a linear
+    fade-out across it, cached per duration so placing it is just an array slice.
+    """
+    num_samples = max(1, int(round(duration * sample_rate)))
+    npy_path = SOUND_BANK_DIR / f"{source_key(path, sample_rate)}_fade{num_samples}.npy"
+    if npy_path.exists():
+        return open_mapped(npy_path)
+    pcm = fit_length(load_sound(path, sample_rate), num_samples)
+    ramp = np.linspace(1.0, 0.0, num_samples, dtype=np.float32)[:, None]
+    return store(pcm * ramp, npy_path)
+
+
+def looped(path, duration, sample_rate=SAMPLE_RATE):
+    """The sound looped or trimmed to `duration` seconds (e.g. background music)."""
+    return fit_length(load_sound(path, sample_rate), max(1, int(round(duration * sample_rate))))
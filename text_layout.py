@@ -0,0 +1,136 @@
+from functools import lru_cache
+from PIL import ImageFont
+
+# -------------------- Font Metrics --------------------
+HYPHEN = "-"
+
+
+@lru_cache(maxsize=None)
+def load_font(font_path, size):
+    """Open a TrueType font once per (path, size)."""
+    return ImageFont.truetype(font_path, size)
+
+
+class FontMetrics:
+    """
+    Memoized advance widths and pair kerning for one font at one size, so
+    measuring a string is a sum of table lookups rather than a render.
+    """
+
+    def __init__(self, font_path, size):
+        self.font = load_font(font_path, size)
+        self.advances = {}
+        self.kerning = {}
+        self.widths = {}  # Whole words/lines already measured
+        self.space = self.advance(" ")
+
+    def advance(self, char):
+        if char not in self.advances:
+            self.advances[char] = self.font.getlength(char)
+        return self.advances[char]
+
+    def kern(self, left, right):
+        pair = left + right
+        if pair not in self.kerning:
+            self.kerning[pair] = self.font.getlength(pair) - self.advance(left) - self.advance(right)
+        return self.kerning[pair]
+
+    def width(self, text):
+        """Advance width of a single line of text, including kerning."""
+        if text not in self.widths:
+            total = sum(self.advance(c) for c in text)
+            self.widths[text] = total + sum(self.kern(a, b) for a, b in zip(text, text[1:]))
+        return self.widths[text]
+
+    def line_height(self, spacing=4):
+        ascent, descent = self.font.getmetrics()
+        return ascent + descent + spacing
+
+
+@lru_cache(maxsize=None)
+def font_metrics(font_path, size):
+    """Shared FontMetrics per (font, size)."""
+    return FontMetrics(font_path, size)
+
+
+# -------------------- Line Breaking --------------------
+def split_to_width(word, metrics, max_width):
+    """Split a word that is wider than max_width into hyphenated pieces that fit."""
+    pieces, current = [], ""
+    for char in word:
+        if current and metrics.width(current + char + HYPHEN) > max_width:
+            pieces.append(current + HYPHEN)
+            current = char
+        else:
+            current += char
+    pieces.append(current)
+    return pieces
+
+
+def fit_words(words, metrics, max_width):
+    """Words with any that cannot fit on a line by themselves split to width."""
+    fitted = []
+    for word in words:
+        if metrics.width(word) > max_width:
+            fitted.extend(split_to_width(word, metrics, max_width))
+        else:
+            fitted.append(word)
+    return fitted
+
+
+def wrap_greedy(words, metrics, max_width):
+    """First-fit line breaking: fill each line before starting the next."""
+    lines, current, current_w = [], [], 0.0
+    for word in words:
+        word_w = metrics.width(word)
+        needed = word_w if not current else current_w + metrics.space + word_w
+        if current and needed > max_width:
+            lines.append(" ".join(current))
+            current, current_w = [word], word_w
+        else:
+            current.append(word)
+            current_w = needed
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+def wrap_balanced(words, metrics, max_width):
+    """
+    Minimum-raggedness line breaking: among layouts with the fewest lines,
+    choose the one whose line widths are most even (centered captions read
+    better as 5+4 words than 8+1).
+    """
+    n = len(words)
+    if n == 0:
+        return []
+    widths = [metrics.width(w) for w in words]
+    # best[i] = (lines, cost, break) for words[i:]
+    best = [None] * n + [(0, 0.0, n)]
+    for i in range(n - 1, -1, -1):
+        line_w = -metrics.space
+        for j in range(i, n):
+            line_w += metrics.space + widths[j]
+            if line_w > max_width and j > i:
+                break
+            lines, cost, _ = best[j + 1]
+            candidate = (lines + 1, cost + (max_width - line_w) ** 2, j + 1)
+            if best[i] is None or candidate[:2] < best[i][:2]:
+                best[i] = candidate
+    lines, i = [], 0
+    while i < n:
+        end = best[i][2]
+        lines.append(" ".join(words[i:end]))
+        i = end
+    return lines
+
+
+def layout_lines(text, font_path, size, max_width, stroke_width=0, balanced=True):
+    """
+    Break text into lines that fit max_width pixels in the given font and size.
+    Stroke adds to both sides of every line, so it is taken off the width.
+    """
+    metrics = font_metrics(font_path, size)
+    usable = max(1, max_width - 2 * stroke_width)
+    words = fit_words(text.split(), metrics, usable)
+    return (wrap_balanced if balanced else wrap_greedy)(words, metrics, usable)
@@ -0,0 +1,242 @@
+import hashlib
+import math
+import os
+import tempfile
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFilter
+from config import OUTPUT_DIR
+from compositor import SpriteClip
+from text_layout import font_metrics
+
+# -------------------- Configuration --------------------
+TEXT_CACHE_DIR = OUTPUT_DIR / "text_cache"
+RENDER_CACHE_SIZE = 512
+ATLAS_CACHE_SIZE = 16
+LINE_SPACING = 4
+
+
+def to_rgb(color):
+    """Colour name, hex string or RGB tuple -> RGB tuple."""
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(int(c) for c in color[:3])
+
+
+def cache_path(key, font_path):
+    """On-disk PNG for a render key; the font file's mtime is part of the key."""
+    stamp = os.stat(font_path).st_mtime_ns if os.path.exists(font_path) else 0
+    digest = hashlib.sha1(repr((key, stamp)).encode()).hexdigest()
+    return TEXT_CACHE_DIR / f"{digest}.png"
+
+
+def effect_margin(shadow, glow):
+    """Extra canvas needed around the box so shadow and glow are not clipped."""
+    margin = 0
+    if shadow:
+        offset_x, offset_y, blur = shadow[:3]
+        margin = max(margin, abs(offset_x) + 2 * blur, abs(offset_y) + 2 * blur)
+    if glow:
+        margin = max(margin, 2 * glow[0])
+    return int(math.ceil(margin))
+
+
+def tinted(alpha, color, opacity):
+    """Solid-colour RGBA layer using alpha (an "L" image) scaled by opacity."""
+    layer = Image.new("RGBA", alpha.size, to_rgb(color) + (0,))
+    layer.putalpha(alpha.point(lambda a: min(255, int(a * opacity))))
+    return layer
+
+
+def compose_effects(text_layer, margin, bg_color=None, bg_opacity=0.0, radius=0, shadow=None, glow=None):
+    """
+    Stack a background box (inset by margin), drop shadow, glow and the RGBA
+    text layer into one image of the text layer's size.
+    """
+    canvas_size = text_layer.size
+    image = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+    if bg_color is not None and bg_opacity > 0:
+        box = ImageDraw.Draw(image)
+        fill = to_rgb(bg_color) + (int(round(255 * bg_opacity)),)
+        box.rounded_rectangle((margin, margin, canvas_size[0] - margin - 1, canvas_size[1] - margin - 1),
+                              radius=radius, fill=fill)
+    text_alpha = text_layer.getchannel("A")
+    if shadow:
+        offset_x, offset_y, blur, shadow_color, shadow_opacity = shadow
+        shifted = Image.new("L", canvas_size, 0)
+        shifted.paste(text_alpha, (int(offset_x), int(offset_y)))
+        if blur > 0:
+            shifted = shifted.filter(ImageFilter.GaussianBlur(radius=blur))
+        image.alpha_composite(tinted(shifted, shadow_color, shadow_opacity))
+    if glow:
+        glow_radius, glow_color, glow_opacity = glow
+        halo = text_alpha.filter(ImageFilter.GaussianBlur(radius=glow_radius))
+        # A blurred mask is faint at the glyph edge; boost it so the halo reads
+        image.alpha_composite(tinted(halo, glow_color, 2 * glow_opacity))
+    image.alpha_composite(text_layer)
+    return image
+
+
+def rasterize(text, font_path, size, color, stroke_color, stroke_width, width, align,
+              bg_color, bg_opacity, padding, radius, opacity, blur_radius, shadow=None, glow=None):
+    """
+    Draw text (lines separated by newlines) into a new RGBA image, composed
+    bottom-up from background box, drop shadow, glow and the text itself.
+    shadow is (offset_x, offset_y, blur, color, opacity); glow is
+    (radius, color, opacity).
+    """
+    metrics = font_metrics(font_path, size)
+    lines = text.split("\n")
+    line_widths = [metrics.width(line) for line in lines]
+    ascent, descent = metrics.font.getmetrics()
+    line_height = ascent + descent + LINE_SPACING
+    margin = effect_margin(shadow, glow)
+    pad_w, pad_h = padding[0] + margin, padding[1] + margin
+
+    inner_w = int(width) if width else int(round(max(line_widths) + 2 * stroke_width))
+    inner_h = line_height * len(lines) - LINE_SPACING + 2 * stroke_width
+    canvas_size = (inner_w + 2 * pad_w, inner_h + 2 * pad_h)
+
+    text_layer = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(text_layer)
+    for idx, (line, line_w) in enumerate(zip(lines, line_widths)):
+        if align == "left":
+            x = pad_w + stroke_width
+        elif align == "right":
+            x = pad_w + inner_w - stroke_width - line_w
+        else:
+            x = pad_w + (inner_w - line_w) / 2
+        y = pad_h + stroke_width + idx * line_height
+        if stroke_color and stroke_width:
+            draw.text((x, y), line, font=metrics.font, fill=to_rgb(color) + (255,),
+                      stroke_width=stroke_width, stroke_fill=to_rgb(stroke_color) + (255,))
+        else:
+            draw.text((x, y), line, font=metrics.font, fill=to_rgb(color) + (255,))
+    if blur_radius > 0:
+        text_layer = text_layer.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+
+    image = compose_effects(text_layer, margin, bg_color, bg_opacity, radius, shadow, glow)
+
+    if opacity < 1.0:
+        alpha = image.getchannel("A").point(lambda a: int(a * opacity))
+        image.putalpha(alpha)
+    return image
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_text(text, font_path, size, color="white", stroke_color=None, stroke_width=0, width=None,
+                align="center", bg_color=None, bg_opacity=0.0, padding=(0, 0), radius=0,
+                opacity=1.0, blur_radius=0, shadow=None, glow=None):
+    """
+    Rasterize text to a read-only (H, W, 4) uint8 RGBA array.
+
+    width fixes the text area (lines are aligned inside it); otherwise it
+    hugs the widest line. bg_color/bg_opacity draw a box with `radius` corners
+    behind the text, `padding` (x, y) pixels outside the text area. shadow and
+    glow are baked into the same image (see rasterize).
+    Renders are memoized in-process and persisted as PNGs, so a recurring
+    caption or CTA is only drawn once. Arguments must be hashable
+    (colours as names or tuples).
+    """
+    key = (text, str(font_path), size, color, stroke_color, stroke_width, width, align,
+           bg_color, bg_opacity, tuple(padding), radius, opacity, blur_radius, shadow, glow)
+    path = cache_path(key, font_path)
+    if path.exists():
+        image = Image.open(path).convert("RGBA")
+    else:
+        image = rasterize(text, font_path, size, color, stroke_color, stroke_width, width, align,
+                          bg_color, bg_opacity, tuple(padding), radius, opacity, blur_radius, shadow, glow)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".png")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format="PNG")
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    array = np.asarray(image)
+    array.flags.writeable = False
+    return array
+
+
+# -------------------- Glyph Atlas --------------------
+class GlyphAtlas:
+    """
+    Fill and stroke coverage masks for each character of one font, size and
+    stroke width, rasterized on first use. A line of text is assembled from
+    these glyph runs with array maxima instead of a Pillow render, so many
+    differently coloured variants of the same words are cheap.
+    """
+
+    def __init__(self, font_path, size, stroke_width=0):
+        self.metrics = font_metrics(font_path, size)
+        self.stroke_width = stroke_width
+        ascent, descent = self.metrics.font.getmetrics()
+        self.height = ascent + descent + 2 * stroke_width
+        self.glyphs = {}
+
+    def glyph(self, char):
+        """(left, top, fill mask, stroke mask) for a character drawn at the origin."""
+        if char not in self.glyphs:
+            font, stroke = self.metrics.font, self.stroke_width
+            left, top, right, bottom = font.getbbox(char, stroke_width=stroke)
+            size = (max(1, right - left), max(1, bottom - top))
+            fill = Image.new("L", size, 0)
+            ImageDraw.Draw(fill).text((-left, -top), char, font=font, fill=255)
+            outline = Image.new("L", size, 0)
+            if stroke:
+                ImageDraw.Draw(outline).text((-left, -top), char, font=font, fill=255,
+                                             stroke_width=stroke, stroke_fill=255)
+            self.glyphs[char] = (left, top, np.asarray(fill), np.asarray(outline))
+        return self.glyphs[char]
+
+    def width(self, text):
+        return int(math.ceil(self.metrics.width(text))) + 2 * self.stroke_width
+
+    def masks(self, text):
+        """Fill and stroke masks for one line, laid out with the font's advances and kerning."""
+        shape = (self.height, self.width(text))
+        fill, outline = np.zeros(shape, dtype=np.uint8), np.zeros(shape, dtype=np.uint8)
+        pen, previous = float(self.stroke_width), None
+        for char in text:
+            if previous is not None:
+                pen += self.metrics.advance(previous) + self.metrics.kern(previous, char)
+            left, top, glyph_fill, glyph_outline = self.glyph(char)
+            x, y = int(round(pen)) + left, self.stroke_width + top
+            h, w = glyph_fill.shape
+            x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, shape[1]), min(y + h, shape[0])
+            if x1 <= x0 or y1 <= y0:
+                previous = char
+                continue
+            window = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+            np.maximum(fill[y0:y1, x0:x1], glyph_fill[window], out=fill[y0:y1, x0:x1])
+            np.maximum(outline[y0:y1, x0:x1], glyph_outline[window], out=outline[y0:y1, x0:x1])
+            previous = char
+        return fill, outline
+
+    def render(self, text, color, stroke_color=None):
+        """(H, W, 4) uint8 RGBA of one line: stroke under fill, as Pillow draws it."""
+        fill, outline = self.masks(text)
+        fill = fill[..., None].astype(np.uint32)
+        rgb = np.empty(fill.shape[:2] + (3,), dtype=np.uint32)
+        rgb[:] = to_rgb(color)
+        if stroke_color and self.stroke_width:
+            # Stroke colour where the outline shows through the fill's coverage
+            under = outline[..., None].astype(np.uint32) * (255 - fill) // 255
+            alpha = fill + under
+            rgb = (rgb * fill + np.array(to_rgb(stroke_color), dtype=np.uint32) * under) // np.maximum(alpha, 1)
+        else:
+            alpha = fill
+        return np.concatenate([rgb, alpha], axis=2).astype(np.uint8)
+
+
+@lru_cache(maxsize=ATLAS_CACHE_SIZE)
+def glyph_atlas(font_path, size, stroke_width=0):
+    """Shared GlyphAtlas per (font, size, stroke width)."""
+    return GlyphAtlas(font_path, size, stroke_width)
+
+
+def text_clip(rgba, fade_in=0, fade_out=0):
+    """Premultiplied sprite clip for a rendered RGBA array."""
+    return SpriteClip(rgba, fade_in=fade_in, fade_out=fade_out)
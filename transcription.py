@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import subprocess
+import tempfile
+from functools import lru_cache
+import openai
+from moviepy.config import get_setting
+from config import OUTPUT_DIR, TRANSCRIPTION_BACKEND, LOCAL_WHISPER_MODEL
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:  # Optional: only needed for the local backend
+    WhisperModel = None
+
+# -------------------- Configuration --------------------
+TRANSCRIPT_CACHE_DIR = OUTPUT_DIR / "transcripts"
+HASH_SAMPLE_RATE = 16000
+HASH_CHUNK_SIZE = 1 << 20
+
+
+# -------------------- Backends --------------------
+class MissingAPIKeyError(ValueError):
+    """The hosted backend was selected without OPENAI_API_KEY set."""
+
+
+# Every backend returns Whisper's verbose_json shape:
+# {"text": str, "segments": [{"start": float, "end": float, "text": str}, ...]}
+def transcribe_openai(audio_file_path):
+    """Hosted Whisper via the OpenAI API."""
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    if not openai.api_key:
+        raise MissingAPIKeyError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+    with open(audio_file_path, "rb") as audio_file:
+        response = openai.Audio.transcribe(
+            file=audio_file,
+            model="whisper-1",
+            response_format="verbose_json"  # Ensure this returns detailed segment info
+        )
+    return json.loads(json.dumps(response))
+
+
+@lru_cache(maxsize=None)
+def local_model(model_name):
+    """Load a CPU, int8-quantized Whisper model once per process."""
+    return WhisperModel(model_name, device="cpu", compute_type="int8")
+
+
+def transcribe_local(audio_file_path):
+    """Offline Whisper on the CPU via faster-whisper (CTranslate2)."""
+    if WhisperModel is None:
+        raise RuntimeError("Local transcription needs faster-whisper: pip install faster-whisper")
+    segments, _ = local_model(LOCAL_WHISPER_MODEL).transcribe(audio_file_path)
+    segments = [{"start": s.start, "end": s.end, "text": s.text} for s in segments]
+    return {"text": "".join(s["text"] for s in segments).strip(), "segments": segments}
+
+
+TRANSCRIPTION_BACKENDS = {
+    "openai": (transcribe_openai, "whisper-1"),
+    "local": (transcribe_local, LOCAL_WHISPER_MODEL),
+}
+
+
+# -------------------- Cache --------------------
+def audio_digest(audio_file_path):
+    """
+    SHA-256 of the decoded audio (16 kHz mono PCM) rather than the file bytes,
+    so the same sound hashes alike across containers (Ogg stream serials are
+    random) and re-extractions.
+    """
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-v", "error", "-i", str(audio_file_path),
+        "-f", "s16le", "-ac", "1", "-ar", str(HASH_SAMPLE_RATE), "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: proc.stdout.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    if proc.wait() != 0:
+        raise RuntimeError(f"Could not decode {audio_file_path}: {proc.stderr.read().decode(errors='replace')}")
+    return digest.hexdigest()
+
+
+def transcribe(audio_file_path, backend=None):
+    """
+    Transcribe with the named backend (default TRANSCRIPTION_BACKEND), reusing
+    a cached result for identical audio so the same narration is never
+    transcribed twice.
+    """
+    backend = backend or TRANSCRIPTION_BACKEND
+    if backend not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{backend}'. "
+                         f"Choose from: {', '.join(TRANSCRIPTION_BACKENDS)}")
+    engine, model = TRANSCRIPTION_BACKENDS[backend]
+    cache_path = TRANSCRIPT_CACHE_DIR / f"{audio_digest(audio_file_path)}_{backend}_{model}.json"
+    if cache_path.exists():
+        print(f"Using cached transcription: {cache_path.name}")
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+
+    result = engine(audio_file_path)
+    TRANSCRIPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TRANSCRIPT_CACHE_DIR, suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return result
@@ -0,0 +1,140 @@
+import bisect
+import math
+import numpy as np
+from moviepy.editor import VideoClip
+
+# -------------------- Transition Names --------------------
+# Visual transition suggested by each scripted transition sound effect
+EFFECT_TRANSITIONS = {
+    "swoosh": "slide",
+    "whoosh": "zoom_through",
+    "glimmer": "glimmer",
+    "fade-in": "crossfade",
+}
+ZOOM_THROUGH_AMOUNT = 0.5  # Extra magnification reached at the cut
+GLIMMER_PEAK = 0.8         # Fraction of the way to white at the flash peak
+
+
+def resolve_transition(name, effect=""):
+    """Map a visual_transition setting ("auto" follows the segment's sound effect) to a transition name."""
+    if name == "auto":
+        return EFFECT_TRANSITIONS.get((effect or "").lower(), "crossfade")
+    return name
+
+
+def smoothstep(u):
+    return u * u * (3 - 2 * u)
+
+
+# -------------------- Blending --------------------
+class TransitionRenderer:
+    """
+    Fixed-point transitions between two (H, W, 3) uint8 frames. Every result
+    is written into buffers allocated once per output size, and the returned
+    frame is reused by the next call.
+    """
+
+    def __init__(self, size):
+        w, h = size
+        self.out = np.empty((h, w, 3), dtype=np.uint8)
+        self.acc = np.empty((h, w, 3), dtype=np.uint16)
+        self.term = np.empty((h, w, 3), dtype=np.uint16)
+        self.rows = np.empty((h, w, 3), dtype=np.uint8)
+        self.zoom_a = np.empty((h, w, 3), dtype=np.uint8)
+        self.zoom_b = np.empty((h, w, 3), dtype=np.uint8)
+        self.grid_y = np.arange(h, dtype=np.float32) - (h - 1) / 2
+        self.grid_x = np.arange(w, dtype=np.float32) - (w - 1) / 2
+
+    def blend(self, a, b, u):
+        """out = (a * (256 - alpha) + b * alpha + 128) >> 8 with alpha = round(256u)."""
+        alpha = int(round(min(max(u, 0.0), 1.0) * 256))
+        np.multiply(a, 256 - alpha, out=self.acc, dtype=np.uint16)
+        np.multiply(b, alpha, out=self.term, dtype=np.uint16)
+        self.acc += self.term
+        self.acc += 128
+        self.acc >>= 8
+        np.copyto(self.out, self.acc, casting="unsafe")
+        return self.out
+
+    def crossfade(self, a, b, u):
+        return self.blend(a, b, u)
+
+    def slide(self, a, b, u):
+        """b pushes a out to the left; pure copies, no blending."""
+        w = self.out.shape[1]
+        offset = int(round(w * smoothstep(u)))
+        self.out[:, :w - offset] = a[:, offset:]
+        self.out[:, w - offset:] = b[:, :offset]
+        return self.out
+
+    def zoomed(self, frame, factor, out):
+        """Nearest-neighbour centre zoom by factor, gathered into out."""
+        h, w = out.shape[:2]
+        rows = np.clip(np.rint(self.grid_y / factor + (h - 1) / 2), 0, h - 1).astype(np.intp)
+        cols = np.clip(np.rint(self.grid_x / factor + (w - 1) / 2), 0, w - 1).astype(np.intp)
+        np.take(frame, rows, axis=0, out=self.rows)
+        np.take(self.rows, cols, axis=1, out=out)
+        return out
+
+    def zoom_through(self, a, b, u):
+        """a zooms in towards the cut while b settles from magnified to rest."""
+        e = smoothstep(u)
+        a = self.zoomed(a, 1 + ZOOM_THROUGH_AMOUNT * e, self.zoom_a)
+        b = self.zoomed(b, 1 + ZOOM_THROUGH_AMOUNT * (1 - e), self.zoom_b)
+        return self.blend(a, b, e)
+
+    def glimmer(self, a, b, u):
+        """Crossfade under a white flash peaking mid-transition."""
+        out = self.blend(a, b, u)
+        beta = int(round(GLIMMER_PEAK * math.sin(math.pi * min(max(u, 0.0), 1.0)) * 256))
+        np.subtract(255, out, out=self.acc, dtype=np.uint16)
+        self.acc *= beta
+        self.acc >>= 8
+        np.add(out, self.acc, out=out, casting="unsafe")
+        return out
+
+    def render(self, name, a, b, u):
+        return getattr(self, name, self.crossfade)(a, b, u)
+
+
+TRANSITIONS = ("crossfade", "slide", "zoom_through", "glimmer")
+
+
+# -------------------- Timeline --------------------
+class TransitionTimeline(VideoClip):
+    """
+    Back-to-back segments with a transition over the first `duration` seconds
+    of each segment after the first. Outside those windows a segment's own
+    frame is returned untouched; inside, the outgoing segment keeps playing
+    (its motion clamped at the end) and is blended with the incoming one.
+
+    segments: list of (start, length, frame_fn or None) with frame_fn(local_t).
+    transitions: one transition name per boundary (len(segments) - 1).
+    """
+
+    def __init__(self, segments, transitions, size, duration):
+        VideoClip.__init__(self)
+        self.size = tuple(size)
+        self.segments = segments
+        self.transitions = transitions
+        self.window = max(float(duration), 0.0)
+        self.starts = [start for start, _, _ in segments]
+        self.duration = self.end = max(start + length for start, length, _ in segments)
+        self.renderer = TransitionRenderer(self.size)
+        w, h = self.size
+        black = np.zeros((h, w, 3), dtype=np.uint8)
+
+        def segment_frame(idx, t):
+            start, _, frame_fn = self.segments[idx]
+            return frame_fn(t - start) if frame_fn else black
+
+        def make_frame(t):
+            idx = max(0, bisect.bisect_right(self.starts, t) - 1)
+            local = t - self.starts[idx]
+            if idx == 0 or local >= self.window:
+                return segment_frame(idx, t)
+            return self.renderer.render(
+                self.transitions[idx - 1], segment_frame(idx - 1, t), segment_frame(idx, t), local / self.window
+            )
+
+        self.make_frame = make_frame
@@ -5,13 +5,19 @@ import numpy as np
 import random
 from pathlib import Path
 from PIL import Image
-from moviepy.editor import (
-    ImageClip, AudioFileClip, concatenate_videoclips, CompositeAudioClip, VideoFileClip
-)
+from moviepy.editor import VideoClip
 from moviepy.video.fx.all import fadein, fadeout
-from moviepy.audio.fx.all import audio_loop, audio_fadein, audio_fadeout
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 from dotenv import load_dotenv
 from config import VIDEO_SIZE, FPS, FINAL_VIDEO_DIR
+from kenburns import KenBurns
+from ffmpeg_backend import render_timeline_ffmpeg
+from audio_mixer import mix_timeline, write_wav, DUCK_GAIN
+from parallel_render import segment_jobs, render_segments_parallel, concat_segments
+from render_profile import get_profile, profile_size
+from compositor import TimelineCompositor
+from frame_writer import write_clip
+from transitions import TransitionTimeline, resolve_transition
 
 # -------------------- PIL Compatibility --------------------
 def ensure_pil_compat():
@@ -50,6 +56,8 @@ DEFAULT_TRANSITION_FADE_DURATION = 0.15
 DEFAULT_TRANSITION_OFFSET = 0.1
 DEFAULT_TRANSITION_SPEED = 1.0
 ZOOM_PERCENT = 0.1
+DEFAULT_ZOOM_MODE = "in_out"
+DEFAULT_ZOOM_EASING = "ease_in_out"
 FALLBACK_QUERIES = [
     'uplifting', 'ambient', 'inspirational', 'calm',
     'soft piano', 'orchestral', 'neutral', 'chill'
@@ -139,108 +147,196 @@ def fetch_transition(effect_name):
     return download_sound(pick, path)
 
 # -------------------- Zoom Effect --------------------
-def zoom_effect(clip):
-    dur = clip.duration
-    def fl(get_frame, t):
-        factor = 1 + ZOOM_PERCENT * (t/(dur/2) if t < dur/2 else (dur-t)/(dur/2))
-        frame = get_frame(t)
-        img = Image.fromarray(frame)
-        resample = Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS
-        sz = img.resize((int(frame.shape[1]*factor), int(frame.shape[0]*factor)), resample)
-        return np.array(sz)
-    return clip.fl(fl, apply_to=['video'])
+def ken_burns_engine(image, duration, size=VIDEO_SIZE, zoom=ZOOM_PERCENT, zoom_mode=DEFAULT_ZOOM_MODE,
+                     pan="none", easing=DEFAULT_ZOOM_EASING, fps=FPS):
+    """KenBurns camera over an image path or array."""
+    if not isinstance(image, np.ndarray):
+        image = Image.open(image)
+    return KenBurns(image, size, duration, zoom=zoom, zoom_mode=zoom_mode, pan=pan, easing=easing, fps=fps)
+
+def ken_burns_clip(image, duration, size=VIDEO_SIZE, **motion):
+    """Zoom/pan clip over an image path or array, rendering exactly `size` frames."""
+    return VideoClip(ken_burns_engine(image, duration, size=size, **motion).frame, duration=duration)
+
+def zoom_effect(clip, **motion):
+    """Apply the Ken Burns zoom to an existing still clip (uses its first frame)."""
+    return ken_burns_clip(clip.get_frame(0), clip.duration, size=clip.size, **motion)
+
+# -------------------- Timeline --------------------
+def audio_duration(path):
+    """Duration of an audio file from its container header (no decode)."""
+    return ffmpeg_parse_infos(str(path))['duration']
+
+def build_timeline(data):
+    """
+    Resolve the script into timed segments. Each entry holds start, duration,
+    image/audio/transition paths (None when missing) and its motion settings.
+    The measured start/duration are also written back to each segment's
+    narration so captions can be placed without transcribing the render.
+    Returns (segments, total_duration).
+    """
+    use_trans = data.get('settings', {}).get('use_transitions', False)
+    segments = []
+    timeline = 0.0
+    for sec in data.get('sections', []):
+        for seg in sec.get('segments', []):
+            narr_info = seg['narration']
+            ap = narr_info.get('audio_path')
+            dur = narr_info.get('duration', 0)
+            if ap and os.path.exists(ap):
+                dur = audio_duration(ap)
+            else:
+                ap = None
+            visual = seg.get('visual', {})
+            img_p = visual.get('image_path')
+            if not (img_p and os.path.exists(img_p)):
+                img_p = None
+            effect = seg.get('sound', {}).get('transition_effect', '')
+            narr_info['start'] = timeline
+            narr_info['duration'] = dur
+            segments.append({
+                'start': timeline,
+                'duration': dur,
+                'image': img_p,
+                'audio': ap,
+                'transition': fetch_transition(effect) if use_trans else None,
+                'transition_effect': effect,
+                'pan': visual.get('pan', 'none'),
+            })
+            timeline += dur
+    return segments, timeline
+
+def write_audio_mix(wav_path, segments, total_dur, **mix_options):
+    """Mix narration, transition SFX and (ducked) background music into one WAV."""
+    print(f"[VERBOSE] Mixing audio: {wav_path}")
+    return write_wav(mix_timeline(segments, total_dur, **mix_options), wav_path)
+
+def write_script_outputs(jp, data, raw_path, final_path, profile_name="final"):
+    """Record the rendered paths in the script JSON (drafts never replace the final)."""
+    if profile_name == "final":
+        data['raw_video'] = str(raw_path)
+        data['final_video'] = str(final_path)
+    else:
+        data[f'{profile_name}_video'] = str(final_path)
+    jp.write_text(json.dumps(data, indent=2), encoding='utf-8')
+    print("[VERBOSE] Done. JSON updated.")
 
 # -------------------- Assemble Video --------------------
-def assemble_video(script_json_path):
+def assemble_video(script_json_path, backend=None, workers=None, profile="final"):
+    """
+    Render the script timeline to FINAL_VIDEO_DIR/<script>.mp4.
+    backend: "moviepy" (default), "ffmpeg" for a single filtergraph render, or
+    "parallel" to encode segments in a process pool and stream-copy concat them;
+    falls back to settings["render_backend"] when not given.
+    profile: a config.RENDER_PROFILES name; "draft" renders a reduced size/fps
+    preview to <script>_draft.mp4.
+    """
     jp = Path(script_json_path).resolve()
     print(f"[VERBOSE] Loading script: {jp}")
     data = json.loads(jp.read_text())
     settings = data.get('settings', {})
-    use_trans = settings.get('use_transitions', False)
     use_bg = settings.get('use_background_music', False)
     bg_setting = data.get('background_music', '')
-    sections = data.get('sections', [])
+    backend = backend or settings.get('render_backend', 'moviepy')
+    render = get_profile(profile)
+    size, fps, preset = profile_size(render), render['fps'], render['preset']
 
     # override or defaults
     bg_volume = settings.get('bg_music_volume', 0.1)
     tv = settings.get('transition_volume', DEFAULT_TRANSITION_VOLUME)
     tf = settings.get('transition_fade_duration', DEFAULT_TRANSITION_FADE_DURATION)
     to = settings.get('transition_offset', DEFAULT_TRANSITION_OFFSET)
+    zoom = settings.get('zoom_percent', ZOOM_PERCENT)
+    zoom_mode = settings.get('zoom_mode', DEFAULT_ZOOM_MODE)
+    zoom_easing = settings.get('zoom_easing', DEFAULT_ZOOM_EASING)
 
-    clips, narrs, trans_auds = [], [], []
-    timeline = 0.0
-
-    # build clips
-    for sec in sections:
-        for seg in sec.get('segments', []):
-            narr_info = seg['narration']
-            ap = narr_info.get('audio_path')
-            dur = narr_info.get('duration', 0)
-            if ap and os.path.exists(ap):
-                ac = AudioFileClip(ap).set_start(timeline)
-                narrs.append(ac)
-                dur = ac.duration
-            img_p = seg.get('visual', {}).get('image_path')
-            if img_p and os.path.exists(img_p):
-                ic = ImageClip(img_p).resize(VIDEO_SIZE).set_duration(dur)
-                ic = zoom_effect(ic).fx(fadein, tf).fx(fadeout, tf).set_start(timeline)
-                clips.append(ic)
-            if use_trans:
-                trp = fetch_transition(seg.get('sound', {}).get('transition_effect', ''))
-                if trp:
-                    ot = AudioFileClip(trp)
-                    ta = ot.subclip(0, tf) if ot.duration >= tf else ot.fx(audio_loop, duration=tf)
-                    ta = audio_fadeout(ta.volumex(tv), tf).set_start(timeline + dur - to)
-                    trans_auds.append(ta)
-            timeline += dur
-
-    if not clips:
+    segments, total_dur = build_timeline(data)
+    if not any(item['image'] for item in segments):
         print("[ERROR] No clips to assemble.")
         return
 
-    # visuals
-    video_no_bg = concatenate_videoclips(clips, method="compose")
-    total_dur = video_no_bg.duration
+    suffix = "" if profile == "final" else f"_{profile}"
+    final_path = Path(FINAL_VIDEO_DIR) / f"{jp.stem}{suffix}.mp4"
+    if backend == 'ffmpeg':
+        bg_file = None
+        if use_bg:
+            bg_file, bg_name = fetch_background_music(bg_setting, total_dur)
+            if bg_file:
+                data['background_music_name'] = bg_name
+        print(f"[VERBOSE] Writing video with ffmpeg filtergraph: {final_path}")
+        rendered = render_timeline_ffmpeg(
+            segments, final_path, total_dur, size=size, fps=fps, preset=preset,
+            bg_music=bg_file, bg_volume=bg_volume, transition_volume=tv, transition_fade=tf,
+            transition_offset=to, zoom=zoom, zoom_mode=zoom_mode, zoom_easing=zoom_easing,
+            visual_transition=settings.get('visual_transition', 'fade'),
+        )
+        if not rendered:
+            return
+        write_script_outputs(jp, data, final_path, final_path, profile)
+        return str(final_path)
 
-    # audio composite
-    audio_comp = CompositeAudioClip(narrs + trans_auds).set_duration(total_dur)
-    raw_video = video_no_bg.set_audio(audio_comp)
-
-    # write raw
-    raw_path = Path(FINAL_VIDEO_DIR) / f"{jp.stem}_raw.mp4"
-    print(f"[VERBOSE] Writing raw video: {raw_path}")
-    raw_video.write_videofile(str(raw_path), fps=FPS, codec='libx264', audio_codec='aac')
-
-    # final with bg
-    final_path = Path(FINAL_VIDEO_DIR) / f"{jp.stem}.mp4"
+    # Audio (music included) is mixed once up front and muxed in the only encode
+    bg_file = None
     if use_bg:
-        print("[VERBOSE] Applying background music...")
         bg_file, bg_name = fetch_background_music(bg_setting, total_dur)
         if bg_file:
-            base = VideoFileClip(str(raw_path))
-            bg_audio = AudioFileClip(bg_file)
-            bg_audio = bg_audio.fx(audio_loop, duration=total_dur) if bg_audio.duration < total_dur else bg_audio.subclip(0, total_dur)
-            bg_audio = bg_audio.volumex(bg_volume)
-            combined = CompositeAudioClip([base.audio, bg_audio]).set_duration(total_dur)
-            final_vid = base.set_audio(combined)
-            print(f"[VERBOSE] Writing final video: {final_path}")
-            final_vid.write_videofile(str(final_path), fps=FPS, codec='libx264', audio_codec='aac')
             data['background_music_name'] = bg_name
-        else:
-            raw_path.rename(final_path)
+    wav_path = Path(FINAL_VIDEO_DIR) / f"{jp.stem}{suffix}_mix.wav"
+    write_audio_mix(
+        wav_path, segments, total_dur, bg_file=bg_file, bg_volume=bg_volume,
+        transition_volume=tv, transition_fade=tf, transition_offset=to,
+        duck=settings.get('duck_background_music', True),
+        duck_gain=settings.get('bg_duck_gain', DUCK_GAIN),
+    )
+
+    if backend == 'parallel':
+        jobs = segment_jobs(segments, size=size, fps=fps, zoom=zoom, zoom_mode=zoom_mode,
+                            zoom_easing=zoom_easing, fade=tf, preset=preset)
+        parts = render_segments_parallel(jobs, workers=workers or settings.get('render_workers'))
+        print(f"[VERBOSE] Joining segments: {final_path}")
+        rendered = concat_segments(parts, final_path, audio_path=wav_path, total_duration=total_dur)
+        wav_path.unlink(missing_ok=True)
+        if not rendered:
+            return
+        write_script_outputs(jp, data, final_path, final_path, profile)
+        return str(final_path)
+
+    motion = dict(size=size, zoom=zoom, zoom_mode=zoom_mode, easing=zoom_easing, fps=fps)
+    visual_transition = settings.get('visual_transition', 'fade')
+    if visual_transition == 'fade':
+        # Each segment fades through black on its own
+        clips = []
+        for item in segments:
+            if item['image']:
+                ic = ken_burns_clip(item['image'], item['duration'], pan=item['pan'], **motion)
+                ic = ic.fx(fadein, tf).fx(fadeout, tf).set_start(item['start'])
+                clips.append(ic)
+        video = TimelineCompositor(clips, size=size)
     else:
-        raw_path.rename(final_path)
+        # Neighbouring segments overlap for tf seconds and are blended
+        timeline = [
+            (item['start'], item['duration'],
+             ken_burns_engine(item['image'], item['duration'], pan=item['pan'], **motion).frame
+             if item['image'] else None)
+            for item in segments
+        ]
+        kinds = [resolve_transition(visual_transition, item['transition_effect']) for item in segments[1:]]
+        print(f"[VERBOSE] Visual transitions: {', '.join(kinds) or 'none'}")
+        video = TransitionTimeline(timeline, kinds, size, tf)
+
+    # visuals + premixed audio, written in a single encode
+    print(f"[VERBOSE] Writing final video: {final_path}")
+    write_clip(video, final_path, fps, preset=preset, audio_path=wav_path)
+    wav_path.unlink(missing_ok=True)
 
     # update JSON
-    data['raw_video'] = str(raw_path)
-    data['final_video'] = str(final_path)
-    jp.write_text(json.dumps(data, indent=2), encoding='utf-8')
-    print("[VERBOSE] Done. JSON updated.")
+    write_script_outputs(jp, data, final_path, final_path, profile)
     return str(final_path)
 
 if __name__ == '__main__':
     import sys
-    if len(sys.argv) != 2:
-        print("Usage: python video_creator.py <script.json>")
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python video_creator.py <script.json> [moviepy|ffmpeg|parallel] [final|draft]")
         sys.exit(1)
-    assemble_video(sys.argv[1])
+    backend = sys.argv[2] if len(sys.argv) > 2 else None
+    assemble_video(sys.argv[1], backend, profile=sys.argv[3] if len(sys.argv) > 3 else "final")